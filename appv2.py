@@ -1,29 +1,20 @@
 import os
-import time
-import uuid
 import requests
 from flask import Flask, request, jsonify, render_template_string
 from dotenv import load_dotenv
+from ingram_client import ingram_client
+from cache_store import PersistentImageCache
 
 load_dotenv()
 
 app = Flask(__name__)
 
-# Credenciales de API (poner en .env)
-CLIENT_ID = os.getenv("INGRAM_CLIENT_ID")
-CLIENT_SECRET = os.getenv("INGRAM_CLIENT_SECRET")
-
 # Credenciales Google Custom Search
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
 
-# Token global
-TOKEN = None
-TOKEN_EXPIRY = 0
-
-# Cache simple para imágenes de Google (evita repetir las mismas búsquedas)
-GOOGLE_IMAGE_CACHE = {}
-CACHE_EXPIRY = 3600  # 1 hora en segundos
+# Cache persistente para imágenes de Google (evita repetir las mismas búsquedas, también entre reinicios)
+GOOGLE_IMAGE_CACHE = PersistentImageCache("google_images")
 
 # Diccionario de logos de marcas conocidas
 BRAND_LOGOS = {
@@ -75,38 +66,12 @@ BRAND_LOGOS = {
 
 def get_token():
     """Obtiene y refresca el token de Ingram (cached)."""
-    global TOKEN, TOKEN_EXPIRY
-    if TOKEN and time.time() < TOKEN_EXPIRY:
-        return TOKEN
-
-    url = "https://api.ingrammicro.com/oauth/oauth20/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    res = requests.post(url, data=data, headers=headers)
-    res.raise_for_status()
-    token_data = res.json()
-
-    TOKEN = token_data["access_token"]
-    TOKEN_EXPIRY = time.time() + int(token_data.get("expires_in", 86399))
-    return TOKEN
+    return ingram_client.get_token()
 
 
 def ingram_headers():
     """Construye headers requeridos por Ingram."""
-    correlation_id = str(uuid.uuid4()).replace("-", "")[:32]
-    return {
-        "Authorization": f"Bearer {get_token()}",
-        "IM-CustomerNumber": os.getenv("INGRAM_CUSTOMER_NUMBER"),
-        "IM-SenderID": os.getenv("INGRAM_SENDER_ID"),
-        "IM-CorrelationID": correlation_id,
-        "IM-CountryCode": os.getenv("INGRAM_COUNTRY_CODE"),
-        "Accept-Language": os.getenv("INGRAM_LANGUAGE", "es-MX"),
-        "Content-Type": "application/json"
-    }
+    return ingram_client.headers()
 
 
 def format_currency(amount, currency_code):
@@ -205,15 +170,10 @@ def get_google_image(query: str):
         print("Google API credentials not configured")
         return None
 
-    # Verificar cache primero
-    cache_key = f"google_{hash(query)}"
-    if cache_key in GOOGLE_IMAGE_CACHE:
-        cached_data = GOOGLE_IMAGE_CACHE[cache_key]
-        if time.time() < cached_data["expiry"]:
-            return cached_data["url"]
-        else:
-            # Eliminar entrada expirada
-            del GOOGLE_IMAGE_CACHE[cache_key]
+    # Verificar cache primero (la clave en disco es un digest estable de la consulta)
+    cached_url = GOOGLE_IMAGE_CACHE.get(query)
+    if cached_url:
+        return cached_url
 
     try:
         url = "https://www.googleapis.com/customsearch/v1"
@@ -237,10 +197,7 @@ def get_google_image(query: str):
                     image_url = item.get("link")
                     if image_url and _is_valid_image_url(image_url):
                         # Guardar en cache
-                        GOOGLE_IMAGE_CACHE[cache_key] = {
-                            "url": image_url,
-                            "expiry": time.time() + CACHE_EXPIRY
-                        }
+                        GOOGLE_IMAGE_CACHE.set(query, image_url)
                         return image_url
         elif r.status_code == 403:
             print("Google API Error: Quota exceeded or invalid credentials")
@@ -426,7 +383,7 @@ def buscar_por_sku_directo(sku_query):
                 "includeProductAttributes": "true"
             }
             
-            res = requests.post(url, headers=ingram_headers(), params=params, json=body)
+            res = ingram_client.post(url, headers=ingram_headers(), params=params, json=body)
             
             if res.status_code == 200:
                 data = res.json()
@@ -470,7 +427,7 @@ def obtener_detalle_producto(part_number):
     """
     try:
         detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{part_number}"
-        detalle_res = requests.get(detail_url, headers=ingram_headers())
+        detalle_res = ingram_client.get(detail_url, headers=ingram_headers())
         return detalle_res.json() if detalle_res.status_code == 200 else {}
     except Exception:
         return {}
@@ -495,7 +452,7 @@ def buscar_en_catalogo_general(query="", vendor="", page_number=1, page_size=25)
         params["vendorName"] = vendor
     
     try:
-        res = requests.get(url, headers=ingram_headers(), params=params)
+        res = ingram_client.get(url, headers=ingram_headers(), params=params)
         data = res.json() if res.status_code == 200 else {}
         
         productos = data.get("catalog", []) if isinstance(data, dict) else []
@@ -716,7 +673,7 @@ def api_buscar():
 def producto_detalle(part_number):
     # Detalle (catalog/details)
     detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{part_number}"
-    detalle_res = requests.get(detail_url, headers=ingram_headers())
+    detalle_res = ingram_client.get(detail_url, headers=ingram_headers())
     detalle = detalle_res.json() if detalle_res.status_code == 200 else {}
 
     # Precio y disponibilidad (priceandavailability)
@@ -727,7 +684,7 @@ def producto_detalle(part_number):
         "includePricing": "true",
         "includeProductAttributes": "true"
     }
-    precio_res = requests.post(price_url, headers=ingram_headers(), params=params, json=body)
+    precio_res = ingram_client.post(price_url, headers=ingram_headers(), params=params, json=body)
     precio = precio_res.json() if precio_res.status_code == 200 else []
     precio_info = precio[0] if isinstance(precio, list) and precio else (precio if isinstance(precio, dict) else {})
 
@@ -1,22 +1,13 @@
 import os
-import time
-import uuid
 import requests
 from flask import Flask, request, jsonify, render_template_string
 from dotenv import load_dotenv
+from ingram_client import ingram_client
 
 load_dotenv()
 
 app = Flask(__name__)
 
-# Credenciales de API (poner en .env)
-CLIENT_ID = os.getenv("INGRAM_CLIENT_ID")
-CLIENT_SECRET = os.getenv("INGRAM_CLIENT_SECRET")
-
-# Token global
-TOKEN = None
-TOKEN_EXPIRY = 0
-
 # Diccionario de logos de marcas conocidas (puedes expandir esta lista)
 BRAND_LOGOS = {
     "hp": "https://upload.wikimedia.org/wikipedia/commons/2/29/HP_New_Logo_2D.svg",
@@ -66,38 +57,12 @@ BRAND_LOGOS = {
 
 def get_token():
     """Obtiene y refresca el token de Ingram (cached)."""
-    global TOKEN, TOKEN_EXPIRY
-    if TOKEN and time.time() < TOKEN_EXPIRY:
-        return TOKEN
-
-    url = "https://api.ingrammicro.com/oauth/oauth20/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    res = requests.post(url, data=data, headers=headers)
-    res.raise_for_status()
-    token_data = res.json()
-
-    TOKEN = token_data["access_token"]
-    TOKEN_EXPIRY = time.time() + int(token_data.get("expires_in", 86399))
-    return TOKEN
+    return ingram_client.get_token()
 
 
 def ingram_headers():
     """Construye headers requeridos por Ingram."""
-    correlation_id = str(uuid.uuid4()).replace("-", "")[:32]
-    return {
-        "Authorization": f"Bearer {get_token()}",
-        "IM-CustomerNumber": os.getenv("INGRAM_CUSTOMER_NUMBER"),
-        "IM-SenderID": os.getenv("INGRAM_SENDER_ID"),
-        "IM-CorrelationID": correlation_id,
-        "IM-CountryCode": os.getenv("INGRAM_COUNTRY_CODE"),
-        "Accept-Language": os.getenv("INGRAM_LANGUAGE", "es-MX"),
-        "Content-Type": "application/json"
-    }
+    return ingram_client.headers()
 
 
 def format_currency(amount, currency_code):
@@ -351,7 +316,7 @@ def buscar_por_sku_directo(sku_query):
                 "includeProductAttributes": "true"
             }
             
-            res = requests.post(url, headers=ingram_headers(), params=params, json=body)
+            res = ingram_client.post(url, headers=ingram_headers(), params=params, json=body)
             
             if res.status_code == 200:
                 data = res.json()
@@ -395,7 +360,7 @@ def obtener_detalle_producto(part_number):
     """
     try:
         detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{part_number}"
-        detalle_res = requests.get(detail_url, headers=ingram_headers())
+        detalle_res = ingram_client.get(detail_url, headers=ingram_headers())
         return detalle_res.json() if detalle_res.status_code == 200 else {}
     except Exception:
         return {}
@@ -420,7 +385,7 @@ def buscar_en_catalogo_general(query="", vendor="", page_number=1, page_size=25)
         params["vendorName"] = vendor
     
     try:
-        res = requests.get(url, headers=ingram_headers(), params=params)
+        res = ingram_client.get(url, headers=ingram_headers(), params=params)
         data = res.json() if res.status_code == 200 else {}
         
         productos = data.get("catalog", []) if isinstance(data, dict) else []
@@ -641,7 +606,7 @@ def api_buscar():
 def producto_detalle(part_number):
     # Detalle (catalog/details)
     detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{part_number}"
-    detalle_res = requests.get(detail_url, headers=ingram_headers())
+    detalle_res = ingram_client.get(detail_url, headers=ingram_headers())
     detalle = detalle_res.json() if detalle_res.status_code == 200 else {}
 
     # Precio y disponibilidad (priceandavailability)
@@ -652,7 +617,7 @@ def producto_detalle(part_number):
         "includePricing": "true",
         "includeProductAttributes": "true"
     }
-    precio_res = requests.post(price_url, headers=ingram_headers(), params=params, json=body)
+    precio_res = ingram_client.post(price_url, headers=ingram_headers(), params=params, json=body)
     precio = precio_res.json() if precio_res.status_code == 200 else []
     precio_info = precio[0] if isinstance(precio, list) and precio else (precio if isinstance(precio, dict) else {})
 
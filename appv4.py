@@ -1,11 +1,10 @@
 import os
-import time
-import uuid
 import requests
 import re
 import json
 from flask import Flask, request, jsonify, render_template_string, session, redirect, url_for
 from dotenv import load_dotenv
+from ingram_client import ingram_client
 from unidecode import unidecode
 
 load_dotenv()
@@ -14,14 +13,8 @@ app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'una-clave-secreta-muy-segura-para-desarrollo')
 
 # Credenciales de API (poner en .env)
-CLIENT_ID = os.getenv("INGRAM_CLIENT_ID")
-CLIENT_SECRET = os.getenv("INGRAM_CLIENT_SECRET")
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
 
-# Token global
-TOKEN = None
-TOKEN_EXPIRY = 0
-
 # Diccionario de normalización de marcas (ampliado)
 BRAND_NORMALIZATION = {
     'perfect choice': 'Perfect Choice',
@@ -117,42 +110,16 @@ def expand_search_terms(query):
         else:
             expanded_terms.append(word)
     
-    # Devolver términos únicos
-    return " ".join(list(set(expanded_terms)))
+    # Devolver términos únicos en orden determinista (la consulta no depende del hash de set)
+    return " ".join(sorted(set(expanded_terms)))
 
 def get_token():
     """Obtiene y refresca el token de Ingram (cached)."""
-    global TOKEN, TOKEN_EXPIRY
-    if TOKEN and time.time() < TOKEN_EXPIRY:
-        return TOKEN
-
-    url = "https://api.ingrammicro.com/oauth/oauth20/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    res = requests.post(url, data=data, headers=headers)
-    res.raise_for_status()
-    token_data = res.json()
-
-    TOKEN = token_data["access_token"]
-    TOKEN_EXPIRY = time.time() + int(token_data.get("expires_in", 86399))
-    return TOKEN
+    return ingram_client.get_token()
 
 def ingram_headers():
     """Construye headers requeridos por Ingram."""
-    correlation_id = str(uuid.uuid4()).replace("-", "")[:32]
-    return {
-        "Authorization": f"Bearer {get_token()}",
-        "IM-CustomerNumber": os.getenv("INGRAM_CUSTOMER_NUMBER"),
-        "IM-SenderID": os.getenv("INGRAM_SENDER_ID"),
-        "IM-CorrelationID": correlation_id,
-        "IM-CountryCode": os.getenv("INGRAM_COUNTRY_CODE"),
-        "Accept-Language": os.getenv("INGRAM_LANGUAGE", "es-MX"),
-        "Content-Type": "application/json"
-    }
+    return ingram_client.headers()
 
 def format_currency(amount, currency_code):
     """Formatea un número con 2 decimales y prefija el código de moneda si existe."""
@@ -543,7 +510,7 @@ def buscar_por_sku_directo(sku_query):
                 "includeProductAttributes": "true"
             }
             
-            res = requests.post(url, headers=ingram_headers(), params=params, json=body)
+            res = ingram_client.post(url, headers=ingram_headers(), params=params, json=body)
             
             if res.status_code == 200:
                 data = res.json()
@@ -586,7 +553,7 @@ def obtener_detalle_producto(part_number):
     """
     try:
         detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{part_number}"
-        detalle_res = requests.get(detail_url, headers=ingram_headers())
+        detalle_res = ingram_client.get(detail_url, headers=ingram_headers())
         return detalle_res.json() if detalle_res.status_code == 200 else {}
     except Exception:
         return {}
@@ -610,7 +577,7 @@ def buscar_en_catalogo_general(query="", vendor="", page_number=1, page_size=25)
         params["vendorName"] = vendor
     
     try:
-        res = requests.get(url, headers=ingram_headers(), params=params)
+        res = ingram_client.get(url, headers=ingram_headers(), params=params)
         data = res.json() if res.status_code == 200 else {}
         
         productos = data.get("catalog", []) if isinstance(data, dict) else []
@@ -670,13 +637,13 @@ def add_to_cart_route(product_id):
     quantity = int(request.form.get('quantity', 1))
     # Obtener datos del producto
     detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{product_id}"
-    detalle_res = requests.get(detail_url, headers=ingram_headers())
+    detalle_res = ingram_client.get(detail_url, headers=ingram_headers())
     detalle = detalle_res.json() if detalle_res.status_code == 200 else {}
     
     price_url = "https://api.ingrammicro.com/resellers/v6/catalog/priceandavailability"
     body = {"products": [{"ingramPartNumber": product_id}]}
     params = {"includePricing": "true"}
-    precio_res = requests.post(price_url, headers=ingram_headers(), params=params, json=body)
+    precio_res = ingram_client.post(price_url, headers=ingram_headers(), params=params, json=body)
     precio_info = precio_res.json()[0] if precio_res.status_code == 200 else {}
     
     product_data = {
@@ -699,7 +666,7 @@ def remove_from_cart_route(product_id):
 def add_to_wishlist_route(product_id):
     # Obtener datos del producto
     detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{product_id}"
-    detalle_res = requests.get(detail_url, headers=ingram_headers())
+    detalle_res = ingram_client.get(detail_url, headers=ingram_headers())
     detalle = detalle_res.json() if detalle_res.status_code == 200 else {}
     
     product_data = {
@@ -1160,7 +1127,7 @@ def catalogo_completo_cards():
 def producto_detalle(part_number):
     # Detalle (catalog/details)
     detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{part_number}"
-    detalle_res = requests.get(detail_url, headers=ingram_headers())
+    detalle_res = ingram_client.get(detail_url, headers=ingram_headers())
     detalle = detalle_res.json() if detalle_res.status_code == 200 else {}
 
     # Precio y disponibilidad (priceandavailability)
@@ -1171,7 +1138,7 @@ def producto_detalle(part_number):
         "includePricing": "true",
         "includeProductAttributes": "true"
     }
-    precio_res = requests.post(price_url, headers=ingram_headers(), params=params, json=body)
+    precio_res = ingram_client.post(price_url, headers=ingram_headers(), params=params, json=body)
     precio = precio_res.json() if precio_res.status_code == 200 else []
     precio_info = precio[0] if isinstance(precio, list) and precio else (precio if isinstance(precio, dict) else {})
 
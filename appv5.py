@@ -1,43 +1,216 @@
+import hmac
 import os
 import time
-import uuid
+import threading
 import requests
 import json
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait
 from flask import Flask, request, jsonify, render_template_string
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
+from ingram_client import ingram_client
+from resilience import UpstreamUnavailable
+from cache_store import InvalidationBus, PersistentImageCache, SingleFlight, SQLiteTokenBucket, build_cache
+from cache_warmer import WARM_ENABLED, CacheWarmer, Prefetcher, QueryLog
+from product_summary import ProductSummary, card_price_fields
+from query_normalizer import CanonicalKeyStats, canonicalize_query, canonicalize_vendor, fold_text
 
 load_dotenv()
 
 app = Flask(__name__)
 
-# Credenciales de API (poner en .env)
-CLIENT_ID = os.getenv("INGRAM_CLIENT_ID")
-CLIENT_SECRET = os.getenv("INGRAM_CLIENT_SECRET")
+# Proxies de confianza delante de la app (1 detrás del router de Heroku). Solo esos saltos
+# de X-Forwarded-For se aceptan; con 0 se usa la dirección del socket y se ignora el encabezado
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 
-# Token global
-TOKEN = None
-TOKEN_EXPIRY = 0
+# Pool acotado para llamadas concurrentes a Ingram (detalles, precios)
+DETAIL_MAX_WORKERS = int(os.getenv("INGRAM_DETAIL_WORKERS", 8))
+DETAIL_TIMEOUT_SECONDS = float(os.getenv("INGRAM_DETAIL_TIMEOUT", 8))
+io_executor = ThreadPoolExecutor(max_workers=DETAIL_MAX_WORKERS, thread_name_prefix="ingram-io")
 
-# Cache para búsquedas
-search_cache = {}
+# Cache para búsquedas, compartida entre workers (CACHE_BACKEND) con copia local LRU acotada
+# TTL suave: pasado este tiempo la página se sirve igual y se revalida en segundo plano
 CACHE_EXPIRY_HOURS = 24
+# TTL duro: pasado este tiempo la entrada ya no se sirve y se consulta Ingram en línea
+CACHE_HARD_EXPIRY_HOURS = int(os.getenv("CACHE_HARD_EXPIRY_HOURS", 72))
+# Horas que se conserva una entrada expirada como respaldo si Ingram no responde
+CACHE_STALE_GRACE_HOURS = 24
+# Segundos durante los que una revalidación en curso evita que otros workers lancen la suya
+CACHE_REVALIDATE_LEASE_SECONDS = 120
+search_cache = build_cache(
+    "search",
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 2000)),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_MB", 64)) * 1024 * 1024,
+    default_ttl=CACHE_HARD_EXPIRY_HOURS * 3600,
+    stale_grace=CACHE_STALE_GRACE_HOURS * 3600,
+    compress=True,
+    admission=True,
+)
+
+# Almacén normalizado de productos del catálogo: cada producto se guarda una sola vez
+# por ingramPartNumber y las páginas de búsqueda solo guardan la lista ordenada de SKUs.
+# Vive lo mismo que la página más larga (TTL duro + gracia) para poder reconstruirla.
+catalog_store = build_cache(
+    "catalog_products",
+    max_entries=int(os.getenv("CATALOG_STORE_MAX_ENTRIES", 50000)),
+    max_bytes=int(os.getenv("CATALOG_STORE_MAX_MB", 64)) * 1024 * 1024,
+    default_ttl=(CACHE_HARD_EXPIRY_HOURS + CACHE_STALE_GRACE_HOURS) * 3600,
+    compress=True,
+)
+
+# Caché por niveles: metadatos de producto (/catalog/details) viven días,
+# precio y existencias (price & availability) solo minutos
+PRODUCT_METADATA_TTL_HOURS = int(os.getenv("PRODUCT_METADATA_TTL_HOURS", 24 * 7))
+PRICE_AVAILABILITY_TTL_MINUTES = int(os.getenv("PRICE_AVAILABILITY_TTL_MINUTES", 10))
+product_cache = build_cache(
+    "product_details",
+    max_entries=int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", 20000)),
+    max_bytes=int(os.getenv("PRODUCT_CACHE_MAX_MB", 64)) * 1024 * 1024,
+    default_ttl=PRODUCT_METADATA_TTL_HOURS * 3600,
+    compress=True,
+)
+price_cache = build_cache(
+    "price_availability",
+    max_entries=int(os.getenv("PRICE_CACHE_MAX_ENTRIES", 20000)),
+    max_bytes=int(os.getenv("PRICE_CACHE_MAX_MB", 32)) * 1024 * 1024,
+    default_ttl=PRICE_AVAILABILITY_TTL_MINUTES * 60,
+)
+# Caché negativa: SKUs confirmados inexistentes (productStatusCode "E", clave en mayúsculas)
+# y búsquedas sin resultados
+NEGATIVE_CACHE_TTL_MINUTES = int(os.getenv("NEGATIVE_CACHE_TTL_MINUTES", 30))
+missing_sku_cache = build_cache(
+    "missing_skus",
+    max_entries=int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", 20000)),
+    max_bytes=8 * 1024 * 1024,
+    default_ttl=NEGATIVE_CACHE_TTL_MINUTES * 60,
+)
+empty_search_cache = build_cache(
+    "empty_searches",
+    max_entries=int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", 20000)),
+    max_bytes=8 * 1024 * 1024,
+    default_ttl=NEGATIVE_CACHE_TTL_MINUTES * 60,
+)
+
+# Búsquedas idénticas concurrentes comparten una sola llamada a Ingram
+search_flight = SingleFlight()
+
+# Métrica del efecto de la canonicalización de consultas sobre la tasa de aciertos
+canonical_key_stats = CanonicalKeyStats()
+
+# Revalidaciones en segundo plano (stale-while-revalidate), con pool propio
+refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+_revalidaciones_pendientes = set()
+_revalidaciones_lock = threading.Lock()
+
+# Guarda los productos de una página en el almacén normalizado y devuelve sus SKUs en orden
+# (los productos sin ingramPartNumber no se pueden referenciar y no se cachean)
+def guardar_productos(productos):
+    part_numbers = []
+    for producto in productos:
+        part_number = producto.ingram_part_number.upper()
+        if part_number:
+            catalog_store.set(part_number, producto)
+            part_numbers.append(part_number)
+    return part_numbers
+
+# Proyecta un producto de Ingram con su tarjeta ya calculada (imagen resuelta, título, marca).
+# Los placeholders no se guardan en el resumen: viven en image_cache con su TTL corto y
+# se completan al servir la página (completar_imagenes). `permitir_busqueda_imagen` limita
+# las búsquedas externas de imagen (precalentamiento y precarga)
+def preparar_resumen(item, permitir_busqueda_imagen=None):
+    resumen = ProductSummary.from_ingram(item)
+    imagen = resolver_imagen(resumen, permitir_busqueda_imagen)
+    resumen.image_url = None if es_placeholder(imagen) else imagen
+    return resumen
+
+# Copias de los productos sin imagen con la que corresponda ahora (de image_cache, o un placeholder)
+def completar_imagenes(productos):
+    return [p.with_image(get_image_url_enhanced(p)) if es_placeholder(p.image_url) else p for p in productos]
+
+# Entrada del nivel de precios: la respuesta de price & availability tal cual y, aparte,
+# los campos de la tarjeta que dependen de ella, calculados una vez por respuesta
+def entrada_precio(info):
+    return {'info': info, 'tarjeta': card_price_fields(info, get_availability_text(info))}
+
+# Reconstruye una página cacheada a partir del almacén de productos;
+# None si alguno de sus productos ya no está (la página cuenta como fallo de caché)
+def hidratar_pagina(data):
+    productos = []
+    for part_number in data['part_numbers']:
+        producto = catalog_store.get(part_number)
+        if producto is None:
+            return None
+        productos.append(producto)
+    return {'productos': productos, 'total_records': data['total_records'], 'pagina_vacia': data['pagina_vacia']}
 
 # Función para guardar en caché
-def save_to_cache(key, data):
-    search_cache[key] = {
+# (con `ttl` la entrada vence a los `ttl` segundos sin periodo de revalidación)
+def save_to_cache(key, data, ttl=None):
+    ahora = time.time()
+    soft_ttl = CACHE_EXPIRY_HOURS * 3600 if ttl is None else ttl
+    hard_ttl = CACHE_HARD_EXPIRY_HOURS * 3600 if ttl is None else ttl
+    search_cache.set(key, {
         'data': data,
-        'expiry': datetime.now() + timedelta(hours=CACHE_EXPIRY_HOURS)
-    }
+        'soft_expiry': ahora + soft_ttl,
+        'hard_expiry': ahora + hard_ttl
+    }, ttl=hard_ttl)
 
 # Función para recuperar del caché
-def get_from_cache(key):
-    if key in search_cache:
-        if datetime.now() < search_cache[key]['expiry']:
-            return search_cache[key]['data']
-        else:
-            del search_cache[key]  # Eliminar entrada expirada
-    return None
+# (allow_stale=True devuelve también entradas expiradas dentro del periodo de gracia)
+def get_from_cache(key, allow_stale=False):
+    entrada = search_cache.get(key, allow_stale=allow_stale)
+    return hidratar_pagina(entrada['data']) if entrada else None
+
+def clave_busqueda(query, vendor, page_number=None, page_size=None):
+    """
+    Canonicaliza consulta y marca (misma clave de caché y misma petición a Ingram
+    para "HP  Laptop", "hp laptop" y "Hp Laptop ") y arma la clave de caché:
+    "{query}_{vendor}_{página}_{tamaño}", o "{query}_{vendor}" sin página.
+    Devuelve (query, vendor, clave).
+    """
+    query = canonicalize_query(query)
+    vendor = canonicalize_vendor(vendor, get_local_vendors())
+    partes = [query, vendor] if page_number is None else [query, vendor, page_number, page_size]
+    return query, vendor, "_".join(str(parte) for parte in partes)
+
+def partes_clave_busqueda(key, con_pagina=True):
+    """Inverso de clave_busqueda: (query, vendor) de una clave (las marcas canónicas no llevan '_')."""
+    partes = key.rsplit('_', 3 if con_pagina else 1)
+    return (partes[0], partes[1]) if len(partes) > 1 else (key, "")
+
+# Función para programar la revalidación en segundo plano de una entrada vencida (TTL suave)
+def schedule_revalidation(key, entrada, refresh_fn):
+    with _revalidaciones_lock:
+        if key in _revalidaciones_pendientes:
+            return False
+        _revalidaciones_pendientes.add(key)
+
+    # La copia L1 conserva el TTL suave viejo aunque otro worker ya haya tomado la
+    # revalidación: releer la entrada compartida antes de decidir
+    entrada = search_cache.reload(key)
+    if entrada is None or time.time() < entrada['soft_expiry']:
+        with _revalidaciones_lock:
+            _revalidaciones_pendientes.discard(key)
+        return False
+
+    # Extender el TTL suave mientras dura la revalidación, para que otros workers no la repitan
+    restante = entrada['hard_expiry'] - time.time()
+    if restante > 0:
+        search_cache.set(key, dict(entrada, soft_expiry=time.time() + CACHE_REVALIDATE_LEASE_SECONDS), ttl=restante)
+
+    def _revalidar():
+        try:
+            refresh_fn()
+        except Exception as e:
+            print(f"Error revalidando caché '{key}': {e}")
+        finally:
+            with _revalidaciones_lock:
+                _revalidaciones_pendientes.discard(key)
+
+    refresh_executor.submit(_revalidar)
+    return True
 
 # Función para obtener marcas disponibles localmente
 def get_local_vendors():
@@ -61,38 +234,12 @@ def get_local_vendors():
 
 def get_token():
     """Obtiene y refresca el token de Ingram (cached)."""
-    global TOKEN, TOKEN_EXPIRY
-    if TOKEN and time.time() < TOKEN_EXPIRY:
-        return TOKEN
-
-    url = "https://api.ingrammicro.com/oauth/oauth20/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    res = requests.post(url, data=data, headers=headers)
-    res.raise_for_status()
-    token_data = res.json()
-
-    TOKEN = token_data["access_token"]
-    TOKEN_EXPIRY = time.time() + int(token_data.get("expires_in", 86399))
-    return TOKEN
+    return ingram_client.get_token()
 
 
 def ingram_headers():
     """Construye headers requeridos por Ingram."""
-    correlation_id = str(uuid.uuid4()).replace("-", "")[:32]
-    return {
-        "Authorization": f"Bearer {get_token()}",
-        "IM-CustomerNumber": os.getenv("INGRAM_CUSTOMER_NUMBER"),
-        "IM-SenderID": os.getenv("INGRAM_SENDER_ID"),
-        "IM-CorrelationID": correlation_id,
-        "IM-CountryCode": os.getenv("INGRAM_COUNTRY_CODE"),
-        "Accept-Language": os.getenv("INGRAM_LANGUAGE", "es-MX"),
-        "Content-Type": "application/json"
-    }
+    return ingram_client.headers()
 
 
 def format_currency(amount, currency_code):
@@ -113,7 +260,7 @@ def get_availability_text(precio_info, detalle=None):
     Usa: precio_info['availability'] preferente, luego detalle['availability'], luego productStatusCode/message.
     """
     av = None
-    if isinstance(precio_info, dict):
+    if isinstance(precio_info, (dict, ProductSummary)):
         av = precio_info.get("availability")
     if not av and detalle and isinstance(detalle, dict):
         av = detalle.get("availability")
@@ -154,7 +301,7 @@ def get_availability_text(precio_info, detalle=None):
             return "Agotado"
 
     # fallback: usar productStatusCode / productStatusMessage
-    if isinstance(precio_info, dict):
+    if isinstance(precio_info, (dict, ProductSummary)):
         code = precio_info.get("productStatusCode")
         msg = precio_info.get("productStatusMessage")
         if code:
@@ -165,14 +312,37 @@ def get_availability_text(precio_info, detalle=None):
     return "No disponible"
 
 
-# Cache para imágenes (evitar llamadas repetidas)
-image_cache = {}
+# Cache persistente de imágenes resueltas (evitar llamadas repetidas, también entre reinicios)
+image_cache = PersistentImageCache(
+    "images",
+    max_entries=int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", 20000)),
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", 8)) * 1024 * 1024,
+    admission=True,
+)
+
+# Búsquedas externas de imagen (Unsplash, de pago) permitidas al precalentar y precargar,
+# para todo el host; el tráfico real no tiene este límite
+PRECARGA_IMAGENES_POR_MINUTO = int(os.getenv("WARM_IMAGE_LOOKUPS_PER_MINUTE", 10))
+imagenes_precarga_budget = SQLiteTokenBucket("images:warm", PRECARGA_IMAGENES_POR_MINUTO,
+                                             burst=max(1, PRECARGA_IMAGENES_POR_MINUTO // 6))
+
+PLACEHOLDER_IMAGE_PREFIX = "https://via.placeholder.com/"
+
+def es_placeholder(url):
+    return not url or url.startswith(PLACEHOLDER_IMAGE_PREFIX)
 
 def get_image_url_enhanced(item):
     """
     Función optimizada que usa información específica del producto para buscar imágenes.
     Prioridad: Ingram -> Cache -> Categoría -> Unsplash -> Placeholder personalizado
     """
+    return resolver_imagen(item)
+
+def resolver_imagen(item, permitir_busqueda=None):
+    """
+    Igual que get_image_url_enhanced; si hace falta la búsqueda externa y
+    permitir_busqueda() la niega, devuelve None sin cachear nada.
+    """
     
     # 1. Intentar imagen de Ingram primero
     try:
@@ -191,14 +361,15 @@ def get_image_url_enhanced(item):
     
     # Usar vendorPartNumber si está disponible (más específico)
     cache_key = vendor_part if vendor_part else sku
-    if cache_key in image_cache:
-        return image_cache[cache_key]
+    cached_image = image_cache.get(cache_key) if cache_key else None
+    if cached_image:
+        return cached_image
     
     # 3. Buscar por categoría y subcategoría de producto
     category_image = get_category_based_image(item)
     if category_image:
         if cache_key:
-            image_cache[cache_key] = category_image
+            image_cache.set(cache_key, category_image)
         return category_image
     
     # 4. Buscar con Unsplash API usando información específica del producto
@@ -207,19 +378,22 @@ def get_image_url_enhanced(item):
     categoria = item.get("category", "")
     subcategoria = item.get("subCategory", "")
     
+    if permitir_busqueda is not None and os.getenv("UNSPLASH_ACCESS_KEY") and not permitir_busqueda():
+        return None
+    
     # Construir query usando información específica
     search_query = build_unsplash_query(marca, producto_nombre, sku, vendor_part, categoria, subcategoria)
     unsplash_image = get_unsplash_image(search_query)
     
     if unsplash_image:
         if cache_key:
-            image_cache[cache_key] = unsplash_image
+            image_cache.set(cache_key, unsplash_image)
         return unsplash_image
     
-    # 5. Fallback con placeholder personalizado
+    # 5. Fallback con placeholder personalizado (TTL corto para reintentar pronto)
     placeholder = generate_custom_placeholder(marca, producto_nombre, sku, vendor_part)
     if cache_key:
-        image_cache[cache_key] = placeholder
+        image_cache.set(cache_key, placeholder, placeholder=True)
     return placeholder
 
 
@@ -317,10 +491,10 @@ def get_category_based_image(item):
     Mapea productos a imágenes de alta calidad por categoría
     Usa información específica de category y subCategory
     """
-    descripcion = item.get("description", "").lower()
-    marca = item.get("vendorName", "").lower()
-    categoria = item.get("category", "").lower()
-    subcategoria = item.get("subCategory", "").lower()
+    descripcion = (item.get("description") or "").lower()
+    marca = (item.get("vendorName") or "").lower()
+    categoria = (item.get("category") or "").lower()
+    subcategoria = (item.get("subCategory") or "").lower()
     
     # Mapeo optimizado con imágenes Unsplash de alta calidad
     category_mapping = {
@@ -464,14 +638,98 @@ def buscar_productos_hibrido(query="", vendor="", page_number=1, page_size=25):
     """
     Búsqueda híbrida que prioriza el caché local y solo usa API para SKUs específicos.
     """
-    # Generar clave única para esta búsqueda
-    cache_key = f"{query}_{vendor}_{page_number}_{page_size}"
+    raw_key = f"{query}_{vendor}_{page_number}_{page_size}"
+    query, vendor, cache_key = clave_busqueda(query, vendor, page_number, page_size)
     
-    # Intentar obtener del caché primero
-    cached_result = get_from_cache(cache_key)
+    # Intentar obtener del caché primero; si pasó el TTL suave se sirve y se revalida en segundo plano
+    entrada = search_cache.get(cache_key)
+    cached_result = hidratar_pagina(entrada['data']) if entrada else None
+    canonical_key_stats.record(raw_key, cache_key, hit=cached_result is not None)
     if cached_result:
-        return cached_result['productos'], cached_result['total_records'], cached_result['pagina_vacia']
+        if time.time() >= entrada['soft_expiry']:
+            schedule_revalidation(cache_key, entrada, lambda: search_flight.do(
+                cache_key, _buscar_y_cachear, cache_key, query, vendor, page_number, page_size, True))
+        return ensamblar_tarjetas(cached_result['productos']), cached_result['total_records'], cached_result['pagina_vacia']
+    
+    try:
+        resultado = search_flight.do(cache_key, _buscar_y_cachear, cache_key, query, vendor, page_number, page_size)
+    except (requests.RequestException, UpstreamUnavailable) as e:
+        # Ingram no disponible: responder de inmediato con la última copia conocida y no cachear el fallo
+        print(f"Ingram no disponible para '{cache_key}': {e}")
+        stale_result = get_from_cache(cache_key, allow_stale=True)
+        if stale_result:
+            return ensamblar_tarjetas(stale_result['productos']), stale_result['total_records'], stale_result['pagina_vacia']
+        return [], 0, True
     
+    # Los precios se ensamblan al momento desde su propio nivel de caché
+    return ensamblar_tarjetas(resultado['productos']), resultado['total_records'], resultado['pagina_vacia']
+
+def pagina_en_cache(query="", vendor="", page_number=1, page_size=25):
+    """True si la página ya está en caché y dentro de su TTL suave."""
+    entrada = search_cache.get(clave_busqueda(query, vendor, page_number, page_size)[2])
+    return bool(entrada) and time.time() < entrada['soft_expiry'] and hidratar_pagina(entrada['data']) is not None
+
+def detalle_en_cache(part_number):
+    """True si el detalle del producto está en caché (o el SKU se sabe inexistente)."""
+    return product_cache.get(part_number) is not None or missing_sku_cache.get(part_number.upper()) is not None
+
+def precargar_busqueda(query="", vendor="", page_number=1, page_size=25):
+    """
+    Precarga una página de búsqueda en la caché (precalentamiento). Sigue el mismo
+    camino que buscar_productos_hibrido, pero sin ensamblar precios (viven minutos)
+    ni contar en las métricas de tráfico real, y con las búsquedas externas de imagen
+    limitadas por PRECARGA_IMAGENES_POR_MINUTO. Devuelve True si hubo que ir a Ingram.
+    """
+    query, vendor, cache_key = clave_busqueda(query, vendor, page_number, page_size)
+    
+    entrada = search_cache.get(cache_key)
+    if entrada and time.time() < entrada['soft_expiry'] and hidratar_pagina(entrada['data']) is not None:
+        return False
+    search_flight.do(cache_key, _buscar_y_cachear, cache_key, query, vendor, page_number, page_size,
+                     entrada is not None, permitir_busqueda_imagen_precarga)
+    return True
+
+def permitir_busqueda_imagen_precarga():
+    return imagenes_precarga_budget.try_acquire(0) is not None
+
+def _buscar_y_cachear(cache_key, query, vendor, page_number, page_size, revalidar=False,
+                      permitir_busqueda_imagen=None):
+    """
+    Ejecuta la búsqueda en Ingram y guarda el resultado antes de liberar a las
+    peticiones coalescidas, para que las siguientes ya lo encuentren en caché.
+    Con revalidar=True ignora la copia existente (refresco stale-while-revalidate).
+    """
+    # Otra petición pudo completar la misma búsqueda mientras esperábamos turno
+    cached_result = None if revalidar else get_from_cache(cache_key)
+    if cached_result:
+        return cached_result
+    
+    productos_finales, total_records, pagina_vacia = _buscar_productos_upstream(query, vendor, page_number, page_size)
+    resultado = {
+        # Proyección compacta con solo metadatos; precio y existencias viven en price_cache
+        'productos': [preparar_resumen(producto, permitir_busqueda_imagen) for producto in productos_finales],
+        'total_records': total_records,
+        'pagina_vacia': pagina_vacia
+    }
+    
+    # Guardar en caché para futuras consultas: los productos en el almacén normalizado
+    # y la página como lista ordenada de SKUs. Las páginas vacías son caché negativa
+    # y viven solo NEGATIVE_CACHE_TTL_MINUTES.
+    if query or vendor:  # Solo cachear búsquedas específicas, no el catálogo completo
+        part_numbers = guardar_productos(resultado['productos'])
+        save_to_cache(cache_key, {
+            'part_numbers': part_numbers,
+            'total_records': total_records,
+            'pagina_vacia': pagina_vacia
+        }, ttl=None if part_numbers else NEGATIVE_CACHE_TTL_MINUTES * 60)
+    
+    return resultado
+
+def _buscar_productos_upstream(query="", vendor="", page_number=1, page_size=25):
+    """
+    Ejecuta la búsqueda híbrida contra Ingram (SKU directo y luego catálogo general).
+    Lanza RequestException/UpstreamUnavailable si el catálogo no está disponible.
+    """
     productos_finales = []
     total_records = 0
     pagina_vacia = False
@@ -495,14 +753,6 @@ def buscar_productos_hibrido(query="", vendor="", page_number=1, page_size=25):
         
         total_records += records_catalogo
     
-    # Guardar en caché para futuras consultas
-    if query or vendor:  # Solo cachear búsquedas específicas, no el catálogo completo
-        save_to_cache(cache_key, {
-            'productos': productos_finales,
-            'total_records': total_records,
-            'pagina_vacia': pagina_vacia
-        })
-    
     return productos_finales, total_records, pagina_vacia
 
 def buscar_por_sku_directo(sku_query):
@@ -524,70 +774,186 @@ def buscar_por_sku_directo(sku_query):
     # Remover duplicados manteniendo orden
     sku_variants = list(dict.fromkeys(sku_variants))
     
-    # Intentar con cada variante (máximo 5 para no saturar la API)
-    for sku in sku_variants[:5]:
-        try:
-            url = "https://api.ingrammicro.com/resellers/v6/catalog/priceandavailability"
-            body = {"products": [{"ingramPartNumber": sku}]}
-            params = {
-                "includeAvailability": "true",
-                "includePricing": "true",
-                "includeProductAttributes": "true"
-            }
-            
-            res = requests.post(url, headers=ingram_headers(), params=params, json=body)
-            
-            if res.status_code == 200:
-                data = res.json()
-                if isinstance(data, list) and data:
-                    producto_info = data[0]
-                    
-                    # Verificar que el producto existe y no tiene error
-                    if (producto_info.get("productStatusCode") != "E" and 
-                        producto_info.get("ingramPartNumber")):
-                        
-                        # Obtener detalles adicionales del producto
-                        detalle = obtener_detalle_producto(producto_info.get("ingramPartNumber"))
-                        
-                        # Combinar información
-                        producto_combinado = {
-                            "ingramPartNumber": producto_info.get("ingramPartNumber"),
-                            "vendorPartNumber": detalle.get("vendorPartNumber"),
-                            "description": (detalle.get("description") or 
-                                          producto_info.get("description") or 
-                                          "Descripción no disponible"),
-                            "vendorName": (detalle.get("vendorName") or 
-                                         producto_info.get("vendorName") or 
-                                         "Marca no disponible"),
-                            "category": detalle.get("category"),
-                            "subCategory": detalle.get("subCategory"),
-                            "productImages": detalle.get("productImages", []),
-                            "pricing": producto_info.get("pricing", {}),
-                            "availability": producto_info.get("availability", {}),
-                            "productStatusCode": producto_info.get("productStatusCode"),
-                            "productStatusMessage": producto_info.get("productStatusMessage")
-                        }
-                        productos.append(producto_combinado)
-                        
-        except Exception as e:
-            print(f"Error buscando SKU {sku}: {e}")
+    # Omitir variantes que Ingram ya confirmó como inexistentes
+    sku_variants = [sku for sku in sku_variants[:5] if missing_sku_cache.get(sku.upper()) is None]
+    if not sku_variants:
+        return productos
+    
+    # Consultar todas las variantes (máximo 5) en una sola llamada a la API
+    try:
+        resultados = ingram_client.price_and_availability(sku_variants)
+    except Exception as e:
+        print(f"Error buscando SKU {sku_query}: {e}")
+        return productos
+
+    # Conciliar localmente: descartar errores y duplicados por ingramPartNumber
+    encontrados = {}
+    inexistentes = {}
+    for producto_info in resultados:
+        part_number = (producto_info.get("ingramPartNumber") or "").upper()
+        if not part_number:
+            continue
+        if producto_info.get("productStatusCode") == "E":
+            inexistentes[part_number] = producto_info
             continue
+        encontrados.setdefault(part_number, producto_info)
+    # Una variante con error no marca como inexistente un SKU que otra variante sí encontró
+    for part_number, producto_info in inexistentes.items():
+        if part_number not in encontrados:
+            missing_sku_cache.set(part_number, producto_info)
+
+    # Aprovechar la respuesta para el nivel de precios
+    for part_number, producto_info in encontrados.items():
+        price_cache.set(part_number, entrada_precio(producto_info))
+
+    # Obtener detalles adicionales de todos los productos en paralelo
+    detalles = obtener_detalles_concurrentes(
+        [producto_info.get("ingramPartNumber") for producto_info in encontrados.values()]
+    )
+
+    for producto_info, detalle in zip(encontrados.values(), detalles):
+        # Combinar información
+        producto_combinado = {
+            "ingramPartNumber": producto_info.get("ingramPartNumber"),
+            "vendorPartNumber": detalle.get("vendorPartNumber"),
+            "description": (detalle.get("description") or 
+                          producto_info.get("description") or 
+                          "Descripción no disponible"),
+            "vendorName": (detalle.get("vendorName") or 
+                         producto_info.get("vendorName") or 
+                         "Marca no disponible"),
+            "category": detalle.get("category"),
+            "subCategory": detalle.get("subCategory"),
+            "productImages": detalle.get("productImages", []),
+            "pricing": producto_info.get("pricing", {}),
+            "availability": producto_info.get("availability", {}),
+            "productStatusCode": producto_info.get("productStatusCode"),
+            "productStatusMessage": producto_info.get("productStatusMessage")
+        }
+        productos.append(producto_combinado)
     
     return productos
 
 
-def obtener_detalle_producto(part_number):
+def obtener_precios(part_numbers, deadline=None):
+    """
+    Precio y existencias por ingramPartNumber (en mayúsculas): la respuesta de
+    price & availability de cada uno, tal como la devolvió Ingram.
+    """
+    return {pn: entrada['info'] for pn, entrada in obtener_entradas_precio(part_numbers, deadline).items()}
+
+
+def obtener_entradas_precio(part_numbers, deadline=None):
+    """
+    Entradas del nivel de precios (entrada_precio) por ingramPartNumber en mayúsculas,
+    desde price_cache. Las que faltan se piden a Ingram en una sola llamada (por bloques)
+    y se cachean con el TTL corto del nivel de precios. `deadline` acota la llamada a Ingram (segundos).
+    """
+    precios = {}
+    faltantes = []
+    for part_number in dict.fromkeys(pn.upper() for pn in part_numbers if pn):
+        entrada = price_cache.get(part_number)
+        if entrada is None:
+            # SKU confirmado como inexistente: responder sin ir a Ingram
+            info = missing_sku_cache.get(part_number)
+            entrada = entrada_precio(info) if info is not None else None
+        if entrada is not None:
+            precios[part_number] = entrada
+        else:
+            faltantes.append(part_number)
+    if not faltantes:
+        return precios
+
+    try:
+        resultados = ingram_client.price_and_availability(faltantes, deadline=deadline)
+    except Exception as e:
+        print(f"Error obteniendo precios de la página: {e}")
+        return precios
+
+    for info in resultados:
+        part_number = (info.get("ingramPartNumber") or "").upper()
+        if not part_number:
+            continue
+        precios[part_number] = entrada_precio(info)
+        if info.get("productStatusCode") == "E":
+            missing_sku_cache.set(part_number, info)
+        else:
+            price_cache.set(part_number, precios[part_number])
+    return precios
+
+
+def ensamblar_tarjetas(productos):
+    """Tarjetas listas para la plantilla: imagen completada y precio del nivel de precios."""
+    return enriquecer_precio_disponibilidad(completar_imagenes(productos))
+
+
+def enriquecer_precio_disponibilidad(productos):
+    """
+    Devuelve copias de los productos (ProductSummary) con precio y existencias del
+    nivel de precios. Los que no están en price_cache se completan con una sola
+    llamada (por bloques) a price & availability; los cacheados no se modifican.
+    """
+    precios = obtener_entradas_precio([p.ingram_part_number for p in productos])
+    if not precios:
+        return productos
+
+    resultado = []
+    for producto in productos:
+        entrada = precios.get(producto.ingram_part_number.upper())
+        resultado.append(producto.with_price(entrada['info'], entrada['tarjeta']) if entrada else producto)
+    return resultado
+
+
+def obtener_detalle_producto(part_number, timeout=None):
     """
-    Obtiene los detalles de un producto específico.
+    Obtiene los detalles de un producto específico. `timeout` es el plazo total de
+    la llamada a Ingram (reintentos incluidos), no solo el de cada intento.
     """
+    # Los metadatos del producto cambian poco: se cachean por días
+    detalle = product_cache.get(part_number)
+    if detalle is not None:
+        return detalle
+    if missing_sku_cache.get(part_number.upper()) is not None:
+        return {}
     try:
         detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{part_number}"
-        detalle_res = requests.get(detail_url, headers=ingram_headers())
-        return detalle_res.json() if detalle_res.status_code == 200 else {}
+        detalle_res = ingram_client.get(detail_url, headers=ingram_headers(), deadline=timeout)
+        if detalle_res.status_code != 200:
+            return {}
+        detalle = detalle_res.json()
+        product_cache.set(part_number, detalle)
+        return detalle
     except Exception:
         return {}
 
 
+def obtener_precio_disponibilidad(part_number, deadline=None):
+    """
+    Obtiene precio y disponibilidad de un solo producto ({} si no hay respuesta).
+    """
+    return obtener_precios([part_number], deadline=deadline).get(part_number.upper(), {})
+
+
+def obtener_detalles_concurrentes(part_numbers, timeout=DETAIL_TIMEOUT_SECONDS):
+    """
+    Obtiene los detalles de varios productos en paralelo usando el pool acotado.
+    Conserva el orden de entrada; un detalle lento o fallido se devuelve como {}
+    sin bloquear a los demás. Cada llamada recibe `timeout` como plazo propio, así
+    que ningún hilo del pool queda ocupado más allá de ese tiempo.
+    """
+    futures = [io_executor.submit(obtener_detalle_producto, pn, timeout) for pn in part_numbers]
+    done, _ = wait(futures, timeout=timeout)
+
+    detalles = []
+    for future in futures:
+        if future in done and future.exception() is None:
+            detalles.append(future.result())
+        else:
+            future.cancel()
+            detalles.append({})
+    return detalles
+
+
 def buscar_en_catalogo_general(query="", vendor="", page_number=1, page_size=25):
     """
     Búsqueda en el catálogo general usando el endpoint GET.
@@ -605,18 +971,33 @@ def buscar_en_catalogo_general(query="", vendor="", page_number=1, page_size=25)
         params["searchInDescription"] = "true"
     if vendor and vendor != "Todas las marcas":
         params["vendor"] = vendor
+    
+    # Búsquedas que ya devolvieron cero registros se responden localmente (cualquier página)
+    empty_key = clave_busqueda(query, vendor)[2]
+    if empty_search_cache.get(empty_key):
+        return [], 0, True
+    
     try:
-        res = requests.get(url, headers=ingram_headers(), params=params)
+        res = ingram_client.get(url, headers=ingram_headers(), params=params)
+        if res.status_code not in (200, 204):
+            # 429, 401/403, 5xx...: no es un resultado vacío y no debe cachearse como tal
+            raise UpstreamUnavailable(f"Catálogo de Ingram respondió {res.status_code} para '{query}'")
         data = res.json() if res.status_code == 200 else {}
         
         productos = data.get("catalog", []) if isinstance(data, dict) else []
         total_records = data.get("recordsFound", 0)
         
+        if not productos and not total_records:
+            empty_search_cache.set(empty_key, True)
+        
         # Detectar si la página está vacía (no hay productos reales)
         pagina_vacia = len(productos) == 0
         
         return productos, total_records, pagina_vacia
         
+    except (requests.RequestException, UpstreamUnavailable):
+        # Falla de Ingram: que el llamador decida (respaldo en caché, sin cachear vacío)
+        raise
     except Exception as e:
         print(f"Error en búsqueda de catálogo: {e}")
         return [], 0, True
@@ -634,6 +1015,9 @@ def catalogo_completo_cards():
         productos, total_records, pagina_vacia = [], 0, False
         welcome_message = True
     else:
+        # Registrar la búsqueda (forma canónica) para el precalentamiento periódico
+        if page_number == 1:
+            query_log.record(canonicalize_query(query), canonicalize_vendor(vendor, get_local_vendors()))
         # Usar búsqueda híbrida
         productos, total_records, pagina_vacia = buscar_productos_hibrido(query, vendor, page_number, page_size)
         welcome_message = False
@@ -656,6 +1040,12 @@ def catalogo_completo_cards():
     if pagina_vacia and page_number > total_pages:
         page_number = total_pages
     
+    # Precarga opt-in de la página siguiente y del detalle de las primeras tarjetas
+    if not welcome_message and productos:
+        prefetcher.after_page(request.remote_addr or "", query, vendor, page_number, page_size,
+                              has_next=page_number < total_pages,
+                              part_numbers=[p.ingram_part_number for p in productos])
+    
     start_record = (page_number - 1) * page_size + 1 if total_records > 0 else 0
     end_record = min(page_number * page_size, total_records)
     
@@ -1415,45 +1805,38 @@ def catalogo_completo_cards():
             <!-- Grid de productos -->
             <div class="products-grid">
                 {% for p in productos %}
-                <a class="product-card" href="/producto/{{ p.get('ingramPartNumber') }}">
+                <a class="product-card" href="/producto/{{ p.ingram_part_number }}">
                     <div class="product-image-container">
-                        <img src="{{ get_image_url_enhanced(p) }}" alt="{{ p.get('description', 'Producto') }}" class="product-image" loading="lazy">
-                        {% if p.get('availability') %}
+                        <img src="{{ p.image_url }}" alt="{{ p.card_title }}" class="product-image" loading="lazy">
+                        {% if p.show_badge %}
                         <div class="product-badge">
                             <i class="fas fa-check"></i> Disponible
                         </div>
                         {% endif %}
                     </div>
                     <div class="product-content">
-                        <div class="product-brand">{{ p.get('vendorName', 'Marca no disponible') }}</div>
-                        <h3 class="product-title">{{ p.get('description', 'Sin descripción') }}</h3>
+                        <div class="product-brand">{{ p.card_brand }}</div>
+                        <h3 class="product-title">{{ p.card_title }}</h3>
                         <div class="product-sku">
                             SKU:
                             <i class="fas fa-barcode"></i>
-                            {{ p.get('ingramPartNumber', 'N/A') }}
-                            {% if p.get('vendorPartNumber') %}
+                            {{ p.ingram_part_number or 'N/A' }}
+                            {% if p.vendor_part_number %}
                             <br>
                             Vendor Part Number(VPN):
                             <small style="font-size: 0.8em; opacity: 0.8;">
-                                <i class="fas fa-tag"></i> {{ p.get('vendorPartNumber') }}
+                                <i class="fas fa-tag"></i> {{ p.vendor_part_number }}
                             </small>
                             {% endif %}
                         </div>
                         <div class="product-details">
                             <div class="product-price">
-                                {% if p.get('pricing') and p.get('pricing').get('customerPrice') %}
-                                    {% set precio_base = p.get('pricing').get('customerPrice') %}
-                                    {% set moneda = p.get('pricing').get('currencyCode', '') %}
-                                    {% set precio_final = (precio_base * 1.10) | round(2) %}
-                                    {{ moneda }} ${{ precio_final | round(2) }}
-                                {% else %}
-                                    Consultar precio
-                                {% endif %}
+                                {{ p.price_label }}
                             </div>
-                            {% if p.get('availability') %}
+                            {% if p.show_badge %}
                             <div class="product-availability availability-available">
                                 <i class="fas fa-check-circle"></i>
-                                {{ get_availability_text(p) | truncate(20) }}
+                                {{ p.availability_label }}
                             </div>
                             {% endif %}
                         </div>
@@ -1554,8 +1937,6 @@ def catalogo_completo_cards():
     return render_template_string(
         html_template,
         productos=productos,
-        get_image_url_enhanced=get_image_url_enhanced,
-        get_availability_text=get_availability_text,
         page_number=page_number,
         total_records=total_records,
         total_pages=total_pages,
@@ -1572,22 +1953,22 @@ def catalogo_completo_cards():
 # ---------- DETALLE DE PRODUCTO PROFESIONAL ----------
 @app.route("/producto/<part_number>", methods=["GET"])
 def producto_detalle(part_number):
-    # Detalle (catalog/details)
-    detail_url = f"https://api.ingrammicro.com/resellers/v6/catalog/details/{part_number}"
-    detalle_res = requests.get(detail_url, headers=ingram_headers())
-    detalle = detalle_res.json() if detalle_res.status_code == 200 else {}
-
-    # Precio y disponibilidad (priceandavailability)
-    price_url = "https://api.ingrammicro.com/resellers/v6/catalog/priceandavailability"
-    body = {"products": [{"ingramPartNumber": part_number}]}
-    params = {
-        "includeAvailability": "true",
-        "includePricing": "true",
-        "includeProductAttributes": "true"
-    }
-    precio_res = requests.post(price_url, headers=ingram_headers(), params=params, json=body)
-    precio = precio_res.json() if precio_res.status_code == 200 else []
-    precio_info = precio[0] if isinstance(precio, list) and precio else (precio if isinstance(precio, dict) else {})
+    # Precio y disponibilidad (priceandavailability) en paralelo con el detalle;
+    # ambas llamadas comparten el plazo DETAIL_TIMEOUT_SECONDS
+    limite = time.monotonic() + DETAIL_TIMEOUT_SECONDS
+    precio_future = io_executor.submit(obtener_precio_disponibilidad, part_number, DETAIL_TIMEOUT_SECONDS)
+
+    # Detalle (catalog/details) e imagen, que depende del detalle; si Ingram no
+    # devuelve el detalle se usa el resumen del almacén de productos del catálogo
+    detalle = obtener_detalle_producto(part_number, DETAIL_TIMEOUT_SECONDS) \
+        or catalog_store.get(part_number.upper()) or {}
+    imagen_url = get_image_url_enhanced(detalle)
+
+    try:
+        precio_info = precio_future.result(timeout=max(limite - time.monotonic(), 0))
+    except FuturesTimeout:
+        print(f"Precio de {part_number} no llegó en {DETAIL_TIMEOUT_SECONDS}s; se muestra sin precio")
+        precio_info = {}
 
     # Obtener pricing y aplicar 10%
     pricing = precio_info.get("pricing") or {}
@@ -1625,9 +2006,6 @@ def producto_detalle(part_number):
             if name:
                 atributos.append({"name": name, "value": value})
 
-    # Usar la función mejorada para obtener imagen
-    imagen_url = get_image_url_enhanced(detalle)
-
     # Template HTML profesional para detalle de producto con nueva paleta
     html_template = """
     <!DOCTYPE html>
@@ -2361,5 +2739,134 @@ def producto_detalle(part_number):
         part_number=part_number
     )
 
+# ---------- MÉTRICAS DE CACHÉ Y CLIENTE INGRAM ----------
+# Métricas y purga son endpoints de administración: exigen X-Admin-Token
+ADMIN_PURGE_TOKEN = os.getenv("ADMIN_PURGE_TOKEN")
+
+def admin_autorizado():
+    return bool(ADMIN_PURGE_TOKEN) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_PURGE_TOKEN)
+
+@app.route("/api/cache-stats", methods=["GET"])
+def cache_stats():
+    if not admin_autorizado():
+        return jsonify({"error": "No autorizado"}), 403
+    return jsonify({
+        "canonicalization": canonical_key_stats.snapshot(),
+        "caches": {
+            "search": search_cache.snapshot(),
+            "catalog_products": catalog_store.snapshot(),
+            "product_details": product_cache.snapshot(),
+            "price_availability": price_cache.snapshot(),
+            "missing_skus": missing_sku_cache.snapshot(),
+            "empty_searches": empty_search_cache.snapshot(),
+            "images": image_cache.snapshot(),
+        },
+        "coalescing": dict(search_flight.stats),
+        "token": ingram_client.token_stats(),
+        "breakers": ingram_client.breaker_stats(),
+        "rate_limits": ingram_client.rate_limit_stats(),
+        "warmup": cache_warmer.snapshot(),
+        "prefetch": prefetcher.snapshot(),
+        "invalidations": invalidation_bus.snapshot(),
+    })
+
+# ---------- INVALIDACIÓN DE CACHÉ ----------
+INVALIDATION_SCOPES = ("sku", "vendor", "query", "all")
+
+def aplicar_invalidacion(scope, value, local_only=True):
+    """
+    Elimina de las cachés de catálogo las entradas afectadas por una invalidación:
+    - sku: páginas que contienen el producto, su detalle, precio, caché negativa e imagen.
+    - vendor: páginas filtradas por la marca o con productos de ella, y sus detalles.
+    - query: páginas y búsquedas vacías cuya consulta canónica empieza con el prefijo.
+    - all: todas las cachés de catálogo (las imágenes resueltas se conservan).
+    Con local_only=True solo se tocan las copias en memoria de este worker.
+    Devuelve {caché: entradas eliminadas}; en las cachés compartidas, por almacén
+    ({"local": n, "shared": m}).
+    """
+    if scope == "sku":
+        sku = value.strip().upper()
+        # Un SKU de Ingram o un número de parte del fabricante
+        eliminados = {sku}
+        def _producto(key, producto):
+            if sku in (key, (producto.get('vendorPartNumber') or '').upper()):
+                eliminados.add(key)
+                return True
+            return False
+        image_cache.delete(sku)
+        return {
+            "catalog_products": catalog_store.delete_where(_producto, local_only),
+            # Sin su producto en el almacén la página ya no se puede reconstruir; se elimina también
+            "search": search_cache.delete_where(
+                lambda _, entrada: not eliminados.isdisjoint(entrada['data'].get('part_numbers', ())), local_only),
+            "product_details": product_cache.delete_where(lambda key, _: key.upper() == sku, local_only),
+            "price_availability": price_cache.delete_where(
+                lambda key, entrada: sku in (key.upper(), (entrada.get('info', entrada).get('vendorPartNumber') or '').upper()),
+                local_only),
+            "missing_skus": missing_sku_cache.delete_where(lambda key, _: key.upper() == sku, local_only),
+        }
+    if scope == "vendor":
+        vendor = canonicalize_vendor(value, get_local_vendors())
+        marca = fold_text(vendor)
+        # Las páginas con productos de la marca quedan sin reconstruir al purgar esos productos
+        return {
+            "search": search_cache.delete_where(lambda key, _: partes_clave_busqueda(key)[1] == vendor, local_only),
+            "catalog_products": catalog_store.delete_where(
+                lambda _, producto: fold_text(producto.get('vendorName')) == marca, local_only),
+            "product_details": product_cache.delete_where(
+                lambda _, detalle: fold_text(detalle.get('vendorName')) == marca, local_only),
+            "empty_searches": empty_search_cache.delete_where(
+                lambda key, _: partes_clave_busqueda(key, con_pagina=False)[1] == vendor, local_only),
+        }
+    if scope == "query":
+        prefijo = canonicalize_query(value)
+        if not prefijo:
+            return {}
+        return {
+            "search": search_cache.delete_where(
+                lambda key, _: partes_clave_busqueda(key)[0].startswith(prefijo), local_only),
+            "empty_searches": empty_search_cache.delete_where(
+                lambda key, _: partes_clave_busqueda(key, con_pagina=False)[0].startswith(prefijo), local_only),
+        }
+    if scope == "all":
+        caches = {"search": search_cache, "catalog_products": catalog_store, "product_details": product_cache,
+                  "price_availability": price_cache, "missing_skus": missing_sku_cache,
+                  "empty_searches": empty_search_cache}
+        return {name: cache.clear(local_only) for name, cache in caches.items()}
+    raise ValueError(f"Alcance de invalidación desconocido: {scope}")
+
+def invalidar_cache(scope, value=""):
+    """Purga el almacén compartido y avisa a los demás workers para que suelten sus copias locales."""
+    eliminadas = aplicar_invalidacion(scope, value, local_only=False)
+    generation = invalidation_bus.publish(scope, value)
+    print(f"Caché invalidada ({scope}={value!r}, generación {generation}): {eliminadas}")
+    return eliminadas, generation
+
+@app.route("/admin/cache/purge", methods=["POST"])
+def admin_cache_purge():
+    if not admin_autorizado():
+        return jsonify({"error": "No autorizado"}), 403
+    payload = request.get_json(silent=True) or request.form
+    scope = (payload.get("scope") or "").strip().lower()
+    value = (payload.get("value") or "").strip()
+    if scope not in INVALIDATION_SCOPES or (scope != "all" and not value):
+        return jsonify({"error": f"Se requiere scope ({', '.join(INVALIDATION_SCOPES)}) y value"}), 400
+    eliminadas, generation = invalidar_cache(scope, value)
+    return jsonify({"scope": scope, "value": value, "generation": generation, "deleted": eliminadas})
+
+invalidation_bus = InvalidationBus()
+invalidation_bus.start(aplicar_invalidacion)
+
+# ---------- PRECALENTAMIENTO DE CACHÉ ----------
+# Al arrancar y cada WARM_INTERVAL_MINUTES: primeras páginas de las marcas más
+# buscadas y las búsquedas más frecuentes del registro
+query_log = QueryLog()
+cache_warmer = CacheWarmer(precargar_busqueda, get_local_vendors, query_log)
+if WARM_ENABLED:
+    cache_warmer.start()
+
+# Precarga durante la navegación (PREFETCH_ENABLED), con presupuesto por usuario
+prefetcher = Prefetcher(precargar_busqueda, obtener_detalle_producto, pagina_en_cache, detalle_en_cache)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
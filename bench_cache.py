@@ -0,0 +1,82 @@
+"""
+Benchmark de la admisión TinyLFU de LRUTTLCache.
+
+Reproduce una distribución de búsquedas (páginas populares de marcas y
+categorías con popularidad tipo Zipf, más una cola larga de consultas que se
+piden una sola vez) contra la misma caché con y sin admisión, y compara la
+tasa de aciertos con el mismo número máximo de entradas.
+
+Uso:
+    python bench_cache.py [--requests 200000] [--capacity 500] [--tail 0.4]
+    python bench_cache.py --from-log ~/.cache/ingram-catalog/shared_cache.sqlite3   # usa el registro de búsquedas real
+"""
+import argparse
+import random
+import sqlite3
+
+from cache_store import LRUTTLCache
+
+
+def distribucion_sintetica(n_claves=5000, s=1.0):
+    """Claves populares con pesos Zipf(s)."""
+    claves = [f"popular_{i}" for i in range(n_claves)]
+    pesos = [1 / (rank ** s) for rank in range(1, n_claves + 1)]
+    return claves, pesos
+
+
+def distribucion_del_registro(path):
+    """Claves y pesos a partir del registro de búsquedas (tabla query_log)."""
+    filas = sqlite3.connect(path).execute(
+        "SELECT query, vendor, COUNT(*) FROM query_log GROUP BY query, vendor"
+    ).fetchall()
+    if not filas:
+        raise SystemExit(f"El registro de búsquedas en {path} está vacío")
+    return [f"{query}_{vendor}" for query, vendor, _ in filas], [n for _, _, n in filas]
+
+
+def generar_trafico(claves, pesos, n_requests, tail, seed):
+    rng = random.Random(seed)
+    populares = rng.choices(claves, weights=pesos, k=n_requests)
+    return [f"cola_{i}" if rng.random() < tail else clave for i, clave in enumerate(populares)]
+
+
+def reproducir(trafico, capacity, admission):
+    cache = LRUTTLCache("bench", max_entries=capacity, max_bytes=1 << 40,
+                        default_ttl=10 ** 9, sizeof=lambda value: 1, admission=admission)
+    aciertos = 0
+    for clave in trafico:
+        if cache.get(clave) is not None:
+            aciertos += 1
+        else:
+            cache.set(clave, True)
+    return aciertos / len(trafico), cache.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--capacity", type=int, default=500)
+    parser.add_argument("--keys", type=int, default=5000, help="claves populares (distribución sintética)")
+    parser.add_argument("--zipf", type=float, default=1.0, help="exponente Zipf (distribución sintética)")
+    parser.add_argument("--tail", type=float, default=0.4, help="fracción de consultas únicas (cola larga)")
+    parser.add_argument("--from-log", help="archivo SQLite con la tabla query_log")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.from_log:
+        claves, pesos = distribucion_del_registro(args.from_log)
+    else:
+        claves, pesos = distribucion_sintetica(args.keys, args.zipf)
+    trafico = generar_trafico(claves, pesos, args.requests, args.tail, args.seed)
+
+    print(f"{args.requests} búsquedas, {len(claves)} claves populares, cola larga {args.tail:.0%}, "
+          f"capacidad {args.capacity} entradas")
+    base, _ = reproducir(trafico, args.capacity, admission=False)
+    tinylfu, snapshot = reproducir(trafico, args.capacity, admission=True)
+    print(f"  LRU           tasa de aciertos {base:.2%}")
+    print(f"  LRU + TinyLFU tasa de aciertos {tinylfu:.2%}  ({snapshot['admission']})")
+    print(f"  Diferencia    {tinylfu - base:+.2%}")
+
+
+if __name__ == "__main__":
+    main()
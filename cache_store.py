@@ -0,0 +1,963 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+import zlib
+from array import array
+from collections import OrderedDict
+
+from resilience import TokenBucket
+
+# Intervalo (segundos) del barrido de entradas expiradas
+CACHE_SWEEP_INTERVAL = float(os.getenv("CACHE_SWEEP_INTERVAL", 60))
+
+# Directorio de datos de la aplicación, privado (0700) y del mismo usuario que corre los workers.
+# Todos los almacenes en disco viven aquí; debe estar en un volumen persistente (ver README)
+CACHE_DATA_DIR = os.getenv("CACHE_DATA_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ingram-catalog"))
+
+# Backend compartido entre workers: "sqlite" (por defecto), "redis" o "memory" (solo local)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite").lower()
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(CACHE_DATA_DIR, "shared_cache.sqlite3"))
+REDIS_URL = os.getenv("REDIS_URL")
+# TTL máximo de la copia local (L1) de una entrada compartida
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", 300))
+
+# Cada cuánto revisa cada worker el canal de invalidaciones (segundos)
+CACHE_INVALIDATION_POLL_SECONDS = float(os.getenv("CACHE_INVALIDATION_POLL_SECONDS", 2))
+
+# Valores serializados a partir de este tamaño se guardan comprimidos con zlib
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 1024))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", 6))
+
+# Almacén persistente de imágenes resueltas (sobrevive al reciclado de workers, y a deploys
+# si CACHE_DATA_DIR está en un volumen persistente)
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", os.path.join(CACHE_DATA_DIR, "image_cache.sqlite3"))
+IMAGE_HIT_TTL_HOURS = float(os.getenv("IMAGE_HIT_TTL_HOURS", 24 * 30))
+IMAGE_PLACEHOLDER_TTL_HOURS = float(os.getenv("IMAGE_PLACEHOLDER_TTL_HOURS", 24))
+
+
+class _Llamada:
+    """Resultado compartido de una ejecución en curso de SingleFlight."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas concurrentes con la misma clave.
+
+    El primer hilo que pide una clave ejecuta la función; los que llegan mientras
+    tanto esperan y reciben el mismo resultado (o la misma excepción), de modo
+    que N fallos de caché simultáneos cuestan una sola llamada a Ingram.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            llamada = self._calls.get(key)
+            es_lider = llamada is None
+            if es_lider:
+                llamada = self._calls[key] = _Llamada()
+                self.stats["leaders"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not es_lider:
+            llamada.event.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.result
+
+        try:
+            llamada.result = fn(*args, **kwargs)
+            return llamada.result
+        except BaseException as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            llamada.event.set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+
+def estimate_size(value):
+    """Tamaño aproximado en bytes de un valor cacheado (serializado)."""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+_PLAIN = b"P"
+_ZLIB = b"Z"
+
+
+def pack_value(value):
+    """Serializa un valor a bytes compactos: pickle, y además zlib si supera CACHE_COMPRESS_MIN_BYTES."""
+    raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(raw) < CACHE_COMPRESS_MIN_BYTES:
+        return _PLAIN + raw
+    return _ZLIB + zlib.compress(raw, CACHE_COMPRESS_LEVEL)
+
+
+def unpack_value(blob):
+    """Inverso de pack_value."""
+    blob = bytes(blob)
+    tag = blob[:1]
+    if tag == _ZLIB:
+        return pickle.loads(zlib.decompress(blob[1:]))
+    if tag == _PLAIN:
+        return pickle.loads(blob[1:])
+    raise ValueError(f"Valor de caché con cabecera desconocida: {tag!r}")
+
+
+class FrequencySketch:
+    """
+    Count-min sketch de contadores de 4 bits (0..15) con envejecimiento periódico:
+    cada `sample_size` incrementos todos los contadores se dividen a la mitad, de
+    modo que la popularidad antigua se olvida. Estima la frecuencia reciente de
+    una clave en memoria constante (`depth` x `width` bytes).
+    """
+
+    MAX_COUNT = 15
+
+    def __init__(self, width=4096, depth=4, sample_size=None):
+        # Ancho potencia de dos para indexar con una máscara
+        self.width = 1 << max(4, (int(width) - 1).bit_length())
+        self.depth = depth
+        self.sample_size = sample_size or 10 * self.width
+        self._mask = self.width - 1
+        self._rows = [array("B", bytes(self.width)) for _ in range(depth)]
+        self._additions = 0
+        self._lock = threading.Lock()
+        self.resets = 0
+
+    def _indexes(self, key):
+        # Doble hashing sobre el hash mezclado: índices independientes en cada fila
+        h = (hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h >> 32, (h & 0xFFFFFFFF) | 1
+        return [(h1 + i * h2) & self._mask for i in range(self.depth)]
+
+    def increment(self, key):
+        with self._lock:
+            for row, i in zip(self._rows, self._indexes(key)):
+                if row[i] < self.MAX_COUNT:
+                    row[i] += 1
+            self._additions += 1
+            if self._additions >= self.sample_size:
+                self._age()
+
+    def estimate(self, key):
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+    def _age(self):
+        for row in self._rows:
+            for i in range(self.width):
+                row[i] >>= 1
+        self._additions //= 2
+        self.resets += 1
+
+
+class TinyLFUAdmission:
+    """
+    Política de admisión TinyLFU: cada acceso (acierto o fallo) suma en el sketch,
+    y una clave nueva solo entra a una caché llena si su frecuencia estimada supera
+    la de la víctima LRU que desplazaría.
+    """
+
+    def __init__(self, max_entries):
+        self.sketch = FrequencySketch(width=4 * max_entries)
+        self.stats = {"admitted": 0, "rejected": 0}
+
+    def record(self, key):
+        self.sketch.increment(key)
+
+    def admit(self, candidate, victim):
+        if self.sketch.estimate(candidate) > self.sketch.estimate(victim):
+            self.stats["admitted"] += 1
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def snapshot(self):
+        return {"sketch_resets": self.sketch.resets, **self.stats}
+
+
+class LRUTTLCache:
+    """
+    Caché en memoria acotada por número de entradas y por bytes, con expulsión
+    LRU y expiración por TTL medida con reloj monotónico.
+
+    Las entradas expiradas se conservan `stale_grace` segundos más para poder
+    servirlas como respaldo (get(..., allow_stale=True)); pasado ese tiempo las
+    elimina el barrido periódico o la siguiente lectura.
+
+    Con compress=True los valores se guardan serializados (pack_value) y cada
+    lectura devuelve una copia nueva; el límite de bytes cuenta el tamaño comprimido.
+
+    Con admission=True una clave nueva solo entra a la caché llena si es más
+    frecuente que la víctima LRU (TinyLFUAdmission); si no, set() devuelve False.
+    """
+
+    def __init__(self, name, max_entries=1000, max_bytes=32 * 1024 * 1024,
+                 default_ttl=3600, stale_grace=0, sizeof=estimate_size, compress=False, admission=False):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stale_grace = stale_grace
+        self.compress = compress
+        self.admission = TinyLFUAdmission(max_entries) if admission else None
+        self._sizeof = len if compress else sizeof
+
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+
+        self.stats = {"hits": 0, "misses": 0, "stale_hits": 0, "evictions": 0, "expirations": 0}
+        _register_for_sweep(self)
+
+    def get(self, key, default=None, allow_stale=False):
+        if self.admission:
+            self.admission.record(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return default
+            value, expires_at, _ = entry
+            if now < expires_at:
+                self._data.move_to_end(key)
+                self.stats["hits"] += 1
+                return unpack_value(value) if self.compress else value
+            if now < expires_at + self.stale_grace:
+                if allow_stale:
+                    self.stats["stale_hits"] += 1
+                    return unpack_value(value) if self.compress else value
+            else:
+                self._remove(key)
+                self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return default
+
+    def reload(self, key, default=None):
+        """Lectura sin copias intermedias; en una caché de un solo proceso equivale a get()."""
+        return self.get(key, default)
+
+    def set(self, key, value, ttl=None):
+        if self.compress:
+            value = pack_value(value)
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            elif self.admission and self._data and (
+                    len(self._data) >= self.max_entries or self._bytes + size > self.max_bytes):
+                victim = next(iter(self._data))
+                victim_vencida = time.monotonic() >= self._data[victim][1] + self.stale_grace
+                if not victim_vencida and not self.admission.admit(key, victim):
+                    return False
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._remove(key) is not None
+
+    def delete_where(self, predicate, local_only=False):
+        """Elimina las entradas para las que predicate(key, value) es verdadero; devuelve cuántas."""
+        with self._lock:
+            entradas = list(self._data.items())
+        borradas = 0
+        for key, (value, _, _) in entradas:
+            if predicate(key, unpack_value(value) if self.compress else value) and self.delete(key):
+                borradas += 1
+        return borradas
+
+    def clear(self, local_only=False):
+        """Vacía la caché; devuelve cuántas entradas eliminó."""
+        with self._lock:
+            borradas = len(self._data)
+            self._data.clear()
+            self._bytes = 0
+        return borradas
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry
+
+    def _evict(self):
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            key, entry = self._data.popitem(last=False)
+            self._bytes -= entry[2]
+            self.stats["evictions"] += 1
+
+    def sweep(self):
+        """Elimina las entradas cuyo TTL (más el periodo de gracia) ya venció."""
+        now = time.monotonic()
+        with self._lock:
+            vencidas = [k for k, (_, expires_at, _) in self._data.items() if now >= expires_at + self.stale_grace]
+            for key in vencidas:
+                self._remove(key)
+            self.stats["expirations"] += len(vencidas)
+        return len(vencidas)
+
+    def snapshot(self):
+        snapshot = {"entries": len(self._data), "bytes": self._bytes, **self.stats}
+        if self.admission:
+            snapshot["admission"] = self.admission.snapshot()
+        return snapshot
+
+
+def connect_private_db(path):
+    """
+    Abre una base SQLite de la aplicación. Los valores de caché se deserializan con
+    pickle, así que nadie más debe poder escribirla: el directorio se crea con
+    permisos 0700 y el archivo con 0600, y se rechaza un directorio o archivo
+    ajeno o un directorio escribible por cualquiera.
+    """
+    directorio = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directorio, mode=0o700, exist_ok=True)
+    info = os.stat(directorio)
+    if info.st_uid != os.getuid() or info.st_mode & 0o002:
+        raise PermissionError(f"El directorio de datos {directorio} no es privado de la aplicación")
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f"La base {path} pertenece a otro usuario")
+    os.chmod(path, 0o600)
+    # SQLite crea los archivos -wal y -shm con los mismos permisos que la base
+    return sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+
+
+class SQLiteCacheBackend:
+    """
+    Almacén compartido por todos los workers de un host sobre SQLite en modo WAL
+    (lectores concurrentes y un escritor). Cada hilo usa su propia conexión.
+    Los tiempos de expiración son de reloj de pared porque se comparten entre procesos.
+    """
+
+    def __init__(self, path=SHARED_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = connect_private_db(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+                " expires_at REAL NOT NULL, keep_until REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_keep_until ON cache (keep_until)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key):
+        """Devuelve (valor_serializado, expires_at) o None."""
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ? AND keep_until > ?",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, namespace, key, blob, expires_at, keep_until):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, keep_until) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, sqlite3.Binary(blob), expires_at, keep_until),
+        )
+
+    def delete(self, namespace, key):
+        self._conn().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace):
+        return self._conn().execute("DELETE FROM cache WHERE namespace = ?", (namespace,)).rowcount
+
+    def purge_expired(self, namespace):
+        cur = self._conn().execute("DELETE FROM cache WHERE namespace = ? AND keep_until <= ?", (namespace, time.time()))
+        return cur.rowcount
+
+    def count(self, namespace):
+        return self._conn().execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def scan(self, namespace):
+        """Todas las entradas del namespace: lista de (key, valor_serializado)."""
+        return self._conn().execute("SELECT key, value FROM cache WHERE namespace = ?", (namespace,)).fetchall()
+
+    def items(self, namespace, limit):
+        """Las `limit` entradas vigentes más recientes: lista de (key, valor_serializado, expires_at)."""
+        return self._conn().execute(
+            "SELECT key, value, expires_at FROM cache WHERE namespace = ? AND expires_at > ?"
+            " ORDER BY expires_at DESC LIMIT ?",
+            (namespace, time.time(), limit),
+        ).fetchall()
+
+
+class RedisCacheBackend:
+    """Almacén compartido sobre Redis (opcional; requiere el paquete `redis` y REDIS_URL)."""
+
+    def __init__(self, url=REDIS_URL):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def _key(self, namespace, key):
+        return f"ingram:{namespace}:{key}"
+
+    def get(self, namespace, key):
+        raw = self._redis.get(self._key(namespace, key))
+        if raw is None:
+            return None
+        expires_at, blob = pickle.loads(raw)
+        return blob, expires_at
+
+    def set(self, namespace, key, blob, expires_at, keep_until):
+        ttl_ms = max(int((keep_until - time.time()) * 1000), 1)
+        self._redis.set(self._key(namespace, key), pickle.dumps((expires_at, blob)), px=ttl_ms)
+
+    def delete(self, namespace, key):
+        self._redis.delete(self._key(namespace, key))
+
+    def clear(self, namespace):
+        return sum(self._redis.delete(k) for k in self._redis.scan_iter(match=self._key(namespace, "*")))
+
+    def purge_expired(self, namespace):
+        return 0  # Redis expira las claves por sí mismo
+
+    def scan(self, namespace):
+        prefijo = len(self._key(namespace, ""))
+        filas = []
+        for k in self._redis.scan_iter(match=self._key(namespace, "*")):
+            raw = self._redis.get(k)
+            if raw is not None:
+                filas.append((k.decode("utf-8")[prefijo:], pickle.loads(raw)[1]))
+        return filas
+
+    def count(self, namespace):
+        return sum(1 for _ in self._redis.scan_iter(match=self._key(namespace, "*")))
+
+
+def create_shared_backend():
+    """Crea el backend compartido configurado en CACHE_BACKEND (None = solo memoria local)."""
+    if CACHE_BACKEND == "memory":
+        return None
+    if CACHE_BACKEND == "redis":
+        if REDIS_URL:
+            try:
+                return RedisCacheBackend(REDIS_URL)
+            except Exception as e:
+                print(f"Redis no disponible ({e}); usando SQLite compartido")
+        else:
+            print("CACHE_BACKEND=redis sin REDIS_URL; usando SQLite compartido")
+    return SQLiteCacheBackend(SHARED_CACHE_PATH)
+
+
+class SharedCache:
+    """
+    Caché compartida entre workers con una copia local LRU (L1) delante.
+
+    Expone la misma interfaz que LRUTTLCache (get/set/delete/clear/sweep),
+    por lo que save_to_cache/get_from_cache no cambian. La copia local vive
+    como máximo LOCAL_CACHE_TTL segundos y nunca más que la entrada compartida.
+    Un error del backend se trata como fallo de caché, nunca como error de la petición.
+    """
+
+    def __init__(self, name, backend, local, default_ttl=3600, stale_grace=0):
+        self.name = name
+        self.backend = backend
+        self.local = local
+        self.default_ttl = default_ttl
+        self.stale_grace = stale_grace
+        self.stats = {"shared_hits": 0, "shared_misses": 0, "errors": 0}
+        _register_for_sweep(self)
+
+    def get(self, key, default=None, allow_stale=False):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            row = self.backend.get(self.name, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error leyendo caché compartida {self.name}: {e}")
+            return default
+        if row is None:
+            self.stats["shared_misses"] += 1
+            return default
+
+        blob, expires_at = row
+        restante = expires_at - time.time()
+        if restante <= 0 and not allow_stale:
+            self.stats["shared_misses"] += 1
+            return default
+        value = unpack_value(blob)
+        self.stats["shared_hits"] += 1
+        if restante > 0:
+            self.local.set(key, value, ttl=min(restante, LOCAL_CACHE_TTL))
+        return value
+
+    def reload(self, key, default=None):
+        """Relee la entrada del almacén compartido descartando la copia L1 (que puede estar desactualizada)."""
+        self.local.delete(key)
+        return self.get(key, default)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.local.set(key, value, ttl=min(ttl, LOCAL_CACHE_TTL))
+        expires_at = time.time() + ttl
+        try:
+            blob = pack_value(value)
+            self.backend.set(self.name, key, blob, expires_at, expires_at + self.stale_grace)
+            return True
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error escribiendo caché compartida {self.name}: {e}")
+            return False
+
+    def delete(self, key):
+        self.local.delete(key)
+        try:
+            self.backend.delete(self.name, key)
+        except Exception as e:
+            print(f"Error borrando de caché compartida {self.name}: {e}")
+
+    def delete_where(self, predicate, local_only=False):
+        """
+        Elimina las entradas que cumplen predicate(key, value). Con local_only=True
+        solo toca la copia L1 de este worker (el almacén compartido ya se purgó).
+        Devuelve las entradas eliminadas por almacén: {"local": n, "shared": m}.
+        """
+        borradas = {"local": self.local.delete_where(predicate)}
+        if local_only:
+            return borradas
+        borradas["shared"] = 0
+        try:
+            for key, blob in self.backend.scan(self.name):
+                if predicate(key, unpack_value(blob)):
+                    self.backend.delete(self.name, key)
+                    borradas["shared"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error purgando caché compartida {self.name}: {e}")
+        return borradas
+
+    def clear(self, local_only=False):
+        """Vacía la caché (solo la copia L1 con local_only=True); devuelve lo eliminado por almacén."""
+        borradas = {"local": self.local.clear()}
+        if local_only:
+            return borradas
+        try:
+            borradas["shared"] = self.backend.clear(self.name)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error limpiando caché compartida {self.name}: {e}")
+        return borradas
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self.local)
+
+    def sweep(self):
+        try:
+            return self.backend.purge_expired(self.name)
+        except Exception as e:
+            print(f"Error barriendo caché compartida {self.name}: {e}")
+            return 0
+
+    def snapshot(self):
+        try:
+            shared_entries = self.backend.count(self.name)
+        except Exception:
+            shared_entries = None
+        return {"backend": type(self.backend).__name__, "shared_entries": shared_entries,
+                "local": self.local.snapshot(), **self.stats}
+
+
+_shared_backend = None
+_shared_backend_lock = threading.Lock()
+
+
+def build_cache(name, max_entries=1000, max_bytes=32 * 1024 * 1024, default_ttl=3600, stale_grace=0,
+                compress=False, admission=False):
+    """
+    Crea la caché `name`: local (LRUTTLCache) o compartida entre workers
+    (SharedCache) según CACHE_BACKEND. Todas comparten el mismo backend.
+    Con compress=True la copia en memoria guarda los valores comprimidos y con
+    admission=True aplica admisión TinyLFU a la copia en memoria.
+    """
+    global _shared_backend
+    local = LRUTTLCache(name, max_entries=max_entries, max_bytes=max_bytes,
+                        default_ttl=default_ttl, stale_grace=stale_grace, compress=compress,
+                        admission=admission)
+    with _shared_backend_lock:
+        if _shared_backend is None:
+            _shared_backend = create_shared_backend()
+    if _shared_backend is None:
+        return local
+    return SharedCache(name, _shared_backend, local, default_ttl=default_ttl, stale_grace=stale_grace)
+
+
+def stable_key(*parts):
+    """Digest estable entre procesos y reinicios (a diferencia de hash()) de un identificador de producto."""
+    texto = "|".join(str(p or "").strip().upper() for p in parts)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+class PersistentImageCache:
+    """
+    Caché de URLs de imagen resueltas respaldada en disco (SQLite), para no
+    repetir búsquedas pagadas (Unsplash/Google/SerpApi/Bing) tras un reinicio.
+
+    - La clave en disco es `stable_key(key)`; conviene pasar vendorPartNumber o SKU.
+    - Los aciertos reales y los placeholders tienen TTL distintos: un placeholder
+      expira pronto para reintentar la búsqueda.
+    - Carga perezosa: la primera lectura de cada worker vuelca a memoria las
+      entradas vigentes más recientes; después las lecturas son locales y los
+      fallos locales consultan el disco (otro worker pudo haberla resuelto).
+    """
+
+    def __init__(self, name, path=IMAGE_CACHE_PATH, max_entries=20000, max_bytes=8 * 1024 * 1024,
+                 hit_ttl=IMAGE_HIT_TTL_HOURS * 3600, placeholder_ttl=IMAGE_PLACEHOLDER_TTL_HOURS * 3600,
+                 admission=False):
+        self.name = name
+        self.hit_ttl = hit_ttl
+        self.placeholder_ttl = placeholder_ttl
+        self.backend = SQLiteCacheBackend(path)
+        self.local = LRUTTLCache(name, max_entries=max_entries, max_bytes=max_bytes, default_ttl=hit_ttl,
+                                 admission=admission)
+        self._loaded_pid = None
+        self._load_lock = threading.Lock()
+        self.stats = {"loaded": 0, "disk_hits": 0, "disk_misses": 0, "placeholders": 0, "errors": 0}
+        _register_for_sweep(self)
+
+    def _ensure_loaded(self):
+        if self._loaded_pid == os.getpid():
+            return
+        with self._load_lock:
+            if self._loaded_pid == os.getpid():
+                return
+            self._loaded_pid = os.getpid()
+            self.local.clear()
+            try:
+                filas = self.backend.items(self.name, self.local.max_entries)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Error cargando caché de imágenes {self.name}: {e}")
+                return
+            ahora = time.time()
+            # Insertar de la que vence antes a la que vence después: las más nuevas quedan como más recientes en el LRU
+            for key, blob, expires_at in reversed(filas):
+                self.local.set(key, bytes(blob).decode("utf-8"), ttl=expires_at - ahora)
+            self.stats["loaded"] = len(filas)
+
+    def get(self, key, default=None):
+        if not key:
+            return default
+        self._ensure_loaded()
+        digest = stable_key(key)
+        url = self.local.get(digest)
+        if url is not None:
+            return url
+        try:
+            row = self.backend.get(self.name, digest)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error leyendo caché de imágenes {self.name}: {e}")
+            return default
+        if row is None or row[1] <= time.time():
+            self.stats["disk_misses"] += 1
+            return default
+        blob, expires_at = row
+        url = bytes(blob).decode("utf-8")
+        self.stats["disk_hits"] += 1
+        self.local.set(digest, url, ttl=expires_at - time.time())
+        return url
+
+    def set(self, key, url, placeholder=False):
+        if not key or not url:
+            return False
+        self._ensure_loaded()
+        ttl = self.placeholder_ttl if placeholder else self.hit_ttl
+        if placeholder:
+            self.stats["placeholders"] += 1
+        digest = stable_key(key)
+        self.local.set(digest, url, ttl=ttl)
+        expires_at = time.time() + ttl
+        try:
+            self.backend.set(self.name, digest, url.encode("utf-8"), expires_at, expires_at)
+            return True
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error escribiendo caché de imágenes {self.name}: {e}")
+            return False
+
+    def delete(self, key):
+        digest = stable_key(key)
+        self.local.delete(digest)
+        try:
+            self.backend.delete(self.name, digest)
+        except Exception as e:
+            print(f"Error borrando de caché de imágenes {self.name}: {e}")
+
+    def clear(self):
+        self.local.clear()
+        try:
+            self.backend.clear(self.name)
+        except Exception as e:
+            print(f"Error limpiando caché de imágenes {self.name}: {e}")
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self.local)
+
+    def sweep(self):
+        try:
+            return self.backend.purge_expired(self.name)
+        except Exception as e:
+            print(f"Error barriendo caché de imágenes {self.name}: {e}")
+            return 0
+
+    def snapshot(self):
+        try:
+            disk_entries = self.backend.count(self.name)
+        except Exception:
+            disk_entries = None
+        return {"backend": "SQLiteCacheBackend", "path": self.backend.path, "disk_entries": disk_entries,
+                "local": self.local.snapshot(), **self.stats}
+
+
+class SQLiteTokenBucket:
+    """
+    Token bucket compartido por todos los workers del host, con la misma interfaz
+    que TokenBucket. El saldo vive en la tabla rate_buckets y cada turno se toma
+    en una transacción BEGIN IMMEDIATE, así que N workers juntos no pasan de
+    `rate_per_minute`. Si SQLite no está disponible se usa un bucket local con la
+    cuota dividida entre los `workers` del host.
+    """
+
+    def __init__(self, key, rate_per_minute, burst=None, path=SHARED_CACHE_PATH, workers=1):
+        self.key = key
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, rate_per_minute // 6))
+        self.path = path
+        self._local = threading.local()
+        self._fallback = TokenBucket(max(rate_per_minute / max(workers, 1), 1))
+        self.stats = {"errors": 0}
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = connect_private_db(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _saldo(self, conn, ahora):
+        row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (self.key,)).fetchone()
+        if row is None:
+            return self.capacity
+        return min(self.capacity, row[0] + max(ahora - row[1], 0) * self.rate)
+
+    def _reservar(self, max_wait):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ahora = time.time()
+            tokens = self._saldo(conn, ahora)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if wait > max_wait:
+                conn.execute("ROLLBACK")
+                return None
+            # Reservar el token (saldo negativo si hay que esperar turno)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (self.key, tokens - 1, ahora),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def try_acquire(self, max_wait=0.0):
+        """Devuelve el tiempo que hubo que esperar, o None si la espera excedía `max_wait`."""
+        try:
+            wait = self._reservar(max_wait)
+        except (sqlite3.Error, OSError) as e:
+            self.stats["errors"] += 1
+            print(f"Error en el limitador compartido '{self.key}', se usa el local: {e}")
+            return self._fallback.try_acquire(max_wait)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def next_available_in(self):
+        try:
+            tokens = self._saldo(self._conn(), time.time())
+        except (sqlite3.Error, OSError):
+            return self._fallback.next_available_in()
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+
+class InvalidationBus:
+    """
+    Canal de invalidaciones entre workers sin broker externo: una tabla SQLite
+    compartida con un contador de generación (autoincremental).
+
+    publish() agrega una invalidación; cada worker revisa el canal cada
+    `poll_interval` segundos y pasa a `handler(kind, value)` las generaciones
+    que aún no aplicó. Un worker nuevo empieza desde la generación actual.
+    """
+
+    def __init__(self, path=SHARED_CACHE_PATH, poll_interval=CACHE_INVALIDATION_POLL_SECONDS, retention_hours=24):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention_hours * 3600
+        self._local = threading.local()
+        self._handler = None
+        self._last_generation = None
+        self._started_pid = None
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "applied": 0, "errors": 0}
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = connect_private_db(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_invalidations ("
+                " generation INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL,"
+                " value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def current_generation(self):
+        row = self._conn().execute("SELECT MAX(generation) FROM cache_invalidations").fetchone()
+        return row[0] or 0
+
+    def publish(self, kind, value=""):
+        """Anuncia una invalidación a todos los workers; devuelve su generación."""
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT INTO cache_invalidations (kind, value, created_at) VALUES (?, ?, ?)",
+            (kind, value, time.time()),
+        )
+        conn.execute("DELETE FROM cache_invalidations WHERE created_at < ?", (time.time() - self.retention,))
+        self.stats["published"] += 1
+        return cur.lastrowid
+
+    def poll(self):
+        """Aplica las invalidaciones pendientes de este worker; devuelve cuántas aplicó."""
+        with self._lock:
+            if self._last_generation is None:
+                self._last_generation = self.current_generation()
+                return 0
+            filas = self._conn().execute(
+                "SELECT generation, kind, value FROM cache_invalidations WHERE generation > ? ORDER BY generation",
+                (self._last_generation,),
+            ).fetchall()
+            for generation, kind, value in filas:
+                try:
+                    self._handler(kind, value)
+                    self.stats["applied"] += 1
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"Error aplicando invalidación {kind}={value!r}: {e}")
+                self._last_generation = generation
+            return len(filas)
+
+    def _poll_loop(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error leyendo canal de invalidaciones: {e}")
+            time.sleep(self.poll_interval)
+
+    def start(self, handler):
+        """Registra el handler y lanza el hilo de sondeo del worker (uno por proceso)."""
+        self._handler = handler
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._last_generation = None
+        threading.Thread(target=self._poll_loop, name="cache-invalidations", daemon=True).start()
+
+    def snapshot(self):
+        return {"last_generation": self._last_generation, **self.stats}
+
+
+# Barrido periódico compartido por todas las cachés del proceso
+_caches_to_sweep = weakref.WeakSet()
+_sweeper_lock = threading.Lock()
+_sweeper_pid = None
+
+
+def _register_for_sweep(cache):
+    global _sweeper_pid
+    _caches_to_sweep.add(cache)
+    with _sweeper_lock:
+        # Un hilo por worker (no sobrevive a un fork)
+        if _sweeper_pid != os.getpid():
+            _sweeper_pid = os.getpid()
+            threading.Thread(target=_sweep_loop, name="cache-sweeper", daemon=True).start()
+
+
+def _sweep_loop():
+    while True:
+        time.sleep(CACHE_SWEEP_INTERVAL)
+        for cache in list(_caches_to_sweep):
+            try:
+                cache.sweep()
+            except Exception as e:
+                print(f"Error barriendo caché {cache.name}: {e}")
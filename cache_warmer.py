@@ -0,0 +1,299 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_store import SHARED_CACHE_PATH, LRUTTLCache, SQLiteTokenBucket, connect_private_db
+from resilience import TokenBucket, UpstreamUnavailable
+
+# Registro de búsquedas (por defecto en el mismo archivo SQLite que la caché compartida)
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", SHARED_CACHE_PATH)
+QUERY_LOG_WINDOW_HOURS = float(os.getenv("QUERY_LOG_WINDOW_HOURS", 24 * 7))
+QUERY_LOG_FLUSH_SIZE = int(os.getenv("QUERY_LOG_FLUSH_SIZE", 50))
+
+# Precalentamiento: qué se precarga, cada cuánto y con qué presupuesto
+WARM_ENABLED = os.getenv("WARM_ENABLED", "true").lower() in ("1", "true", "yes")
+WARM_TOP_VENDORS = int(os.getenv("WARM_TOP_VENDORS", 10))
+WARM_PAGES = int(os.getenv("WARM_PAGES", 2))
+WARM_TOP_QUERIES = int(os.getenv("WARM_TOP_QUERIES", 50))
+WARM_CONCURRENCY = int(os.getenv("WARM_CONCURRENCY", 2))
+WARM_RATE_PER_MINUTE = int(os.getenv("WARM_RATE_PER_MINUTE", 30))
+WARM_START_DELAY_SECONDS = float(os.getenv("WARM_START_DELAY_SECONDS", 15))
+WARM_INTERVAL_MINUTES = float(os.getenv("WARM_INTERVAL_MINUTES", 60))
+
+# Precarga durante la navegación (opt-in): página siguiente y detalle de las primeras tarjetas
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+PREFETCH_TOP_CARDS = int(os.getenv("PREFETCH_TOP_CARDS", 4))
+PREFETCH_BUDGET_PER_MINUTE = int(os.getenv("PREFETCH_BUDGET_PER_MINUTE", 6))
+# Tope de precargas para todo el host (todos los usuarios y workers juntos)
+PREFETCH_GLOBAL_BUDGET_PER_MINUTE = int(os.getenv("PREFETCH_GLOBAL_BUDGET_PER_MINUTE", 60))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 2))
+
+
+class QueryLog:
+    """
+    Registro de búsquedas canónicas (consulta, marca) compartido por los workers del host.
+
+    Las búsquedas se acumulan en memoria y se escriben en bloque cada
+    QUERY_LOG_FLUSH_SIZE registros, para no agregar una escritura por petición.
+    """
+
+    def __init__(self, path=QUERY_LOG_PATH, window_hours=QUERY_LOG_WINDOW_HOURS, flush_size=QUERY_LOG_FLUSH_SIZE):
+        self.path = path
+        self.window = window_hours * 3600
+        self.flush_size = flush_size
+        self._local = threading.local()
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = connect_private_db(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_log ("
+                " query TEXT NOT NULL, vendor TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS query_log_ts ON query_log (ts)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS warm_lease ("
+                " name TEXT PRIMARY KEY, holder TEXT NOT NULL, until REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def record(self, query, vendor=""):
+        if not query and not vendor:
+            return
+        with self._lock:
+            self._buffer.append((query, vendor, time.time()))
+            if len(self._buffer) < self.flush_size:
+                return
+            pendientes, self._buffer = self._buffer, []
+        self._write(pendientes)
+
+    def flush(self):
+        with self._lock:
+            pendientes, self._buffer = self._buffer, []
+        self._write(pendientes)
+
+    def _write(self, filas):
+        if not filas:
+            return
+        try:
+            conn = self._conn()
+            conn.executemany("INSERT INTO query_log (query, vendor, ts) VALUES (?, ?, ?)", filas)
+            conn.execute("DELETE FROM query_log WHERE ts < ?", (time.time() - self.window,))
+        except Exception as e:
+            print(f"Error escribiendo registro de búsquedas: {e}")
+
+    def top_queries(self, limit):
+        """Las búsquedas más frecuentes de la ventana: lista de (query, vendor, veces)."""
+        self.flush()
+        return self._conn().execute(
+            "SELECT query, vendor, COUNT(*) AS n FROM query_log WHERE ts >= ?"
+            " GROUP BY query, vendor ORDER BY n DESC LIMIT ?",
+            (time.time() - self.window, limit),
+        ).fetchall()
+
+    def top_vendors(self, limit):
+        """Las marcas más usadas como filtro en la ventana, de más a menos frecuente."""
+        self.flush()
+        return [row[0] for row in self._conn().execute(
+            "SELECT vendor, COUNT(*) AS n FROM query_log WHERE ts >= ? AND vendor != ''"
+            " GROUP BY vendor ORDER BY n DESC LIMIT ?",
+            (time.time() - self.window, limit),
+        )]
+
+    def try_lease(self, name, seconds):
+        """Reserva `name` durante `seconds` para un solo worker del host; True si se obtuvo."""
+        holder = f"{os.getpid()}"
+        ahora = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO warm_lease (name, holder, until) VALUES (?, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, until = excluded.until"
+            " WHERE warm_lease.until <= ?",
+            (name, holder, ahora + seconds, ahora),
+        )
+        return cur.rowcount == 1
+
+
+class CacheWarmer:
+    """
+    Precarga la caché de búsquedas al arrancar y periódicamente.
+
+    Cada ronda precarga las páginas 1..`pages` de las `top_vendors` marcas
+    (las más buscadas primero, completando con el orden de `vendors_fn`) y
+    repite las `top_queries` búsquedas más frecuentes del registro.
+
+    Para no competir con el tráfico real: como máximo `concurrency` búsquedas
+    a la vez, un token bucket propio de `rate_per_minute` búsquedas, una sola
+    ronda por host (lease en el registro) y la ronda se aborta si Ingram deja
+    de estar disponible (circuito abierto o límite de tasa).
+    """
+
+    def __init__(self, warm_fn, vendors_fn, query_log, top_vendors=WARM_TOP_VENDORS, pages=WARM_PAGES,
+                 top_queries=WARM_TOP_QUERIES, concurrency=WARM_CONCURRENCY,
+                 rate_per_minute=WARM_RATE_PER_MINUTE, interval_minutes=WARM_INTERVAL_MINUTES):
+        self.warm_fn = warm_fn
+        self.vendors_fn = vendors_fn
+        self.query_log = query_log
+        self.top_vendors = top_vendors
+        self.pages = pages
+        self.top_queries = top_queries
+        self.concurrency = concurrency
+        self.rate_per_minute = rate_per_minute
+        self.interval = interval_minutes * 60
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self.stats = {"runs": 0, "skipped_runs": 0, "warmed": 0, "already_fresh": 0, "errors": 0,
+                      "aborted_runs": 0, "last_run_seconds": None, "last_run_at": None}
+
+    def plan(self):
+        """Lista ordenada y sin duplicados de (query, vendor, page_number) a precargar."""
+        conocidas = self.vendors_fn()
+        try:
+            populares = [v for v in self.query_log.top_vendors(self.top_vendors) if v in conocidas]
+            frecuentes = self.query_log.top_queries(self.top_queries)
+        except Exception as e:
+            print(f"Error leyendo registro de búsquedas: {e}")
+            populares, frecuentes = [], []
+        marcas = list(dict.fromkeys(populares + list(conocidas)))[:self.top_vendors]
+
+        trabajos = [("", marca, page) for marca in marcas for page in range(1, self.pages + 1)]
+        trabajos += [(query, vendor, 1) for query, vendor, _ in frecuentes]
+        return list(dict.fromkeys(trabajos))
+
+    def run_once(self):
+        """Ejecuta una ronda completa de precalentamiento (bloqueante)."""
+        inicio = time.monotonic()
+        trabajos = self.plan()
+        bucket = TokenBucket(self.rate_per_minute, burst=self.concurrency)
+        abortar = threading.Event()
+
+        def _precargar(trabajo):
+            if abortar.is_set():
+                return
+            bucket.try_acquire(max_wait=float("inf"))
+            try:
+                if self.warm_fn(*trabajo):
+                    self.stats["warmed"] += 1
+                else:
+                    self.stats["already_fresh"] += 1
+            except UpstreamUnavailable as e:
+                print(f"Precalentamiento abortado: {e}")
+                abortar.set()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Error precalentando {trabajo}: {e}")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="cache-warm") as executor:
+            list(executor.map(_precargar, trabajos))
+
+        self.stats["runs"] += 1
+        self.stats["aborted_runs"] += abortar.is_set()
+        self.stats["last_run_seconds"] = round(time.monotonic() - inicio, 2)
+        self.stats["last_run_at"] = time.time()
+        print(f"Precalentamiento de caché: {len(trabajos)} búsquedas en {self.stats['last_run_seconds']}s")
+
+    def _loop(self, start_delay):
+        time.sleep(start_delay)
+        while True:
+            try:
+                # Una sola ronda por intervalo en todo el host, aunque haya varios workers
+                if self.query_log.try_lease("cache_warm", self.interval * 0.9):
+                    self.run_once()
+                else:
+                    self.stats["skipped_runs"] += 1
+            except Exception as e:
+                print(f"Error en precalentamiento de caché: {e}")
+            time.sleep(self.interval)
+
+    def start(self, start_delay=WARM_START_DELAY_SECONDS):
+        """Lanza el hilo de precalentamiento del worker (uno por proceso, no sobrevive a un fork)."""
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._loop, args=(start_delay,), name="cache-warmer", daemon=True).start()
+
+    def snapshot(self):
+        return dict(self.stats)
+
+
+class Prefetcher:
+    """
+    Precarga en segundo plano lo que un usuario probablemente pedirá después de
+    ver una página del catálogo: la página siguiente y el detalle de las primeras
+    `top_cards` tarjetas.
+
+    Solo lo que no está ya en caché consume presupuesto: cada usuario (dirección
+    del cliente) tiene un token bucket de `budget_per_minute` llamadas a Ingram
+    por minuto, y todas las precargas del host comparten otro de
+    `global_budget_per_minute`, de modo que rotar direcciones no multiplica el
+    gasto. Sin saldo la precarga simplemente se omite.
+    """
+
+    def __init__(self, page_fn, detail_fn, page_cached, detail_cached, enabled=PREFETCH_ENABLED,
+                 top_cards=PREFETCH_TOP_CARDS, budget_per_minute=PREFETCH_BUDGET_PER_MINUTE, workers=PREFETCH_WORKERS,
+                 global_budget_per_minute=PREFETCH_GLOBAL_BUDGET_PER_MINUTE):
+        self.page_fn = page_fn
+        self.detail_fn = detail_fn
+        self.page_cached = page_cached
+        self.detail_cached = detail_cached
+        self.enabled = enabled
+        self.top_cards = top_cards
+        self.budget_per_minute = budget_per_minute
+        self._budgets = LRUTTLCache("prefetch_budgets", max_entries=10000, default_ttl=600, sizeof=lambda bucket: 256)
+        self._budgets_lock = threading.Lock()
+        self._global_budget = SQLiteTokenBucket("prefetch:global", global_budget_per_minute,
+                                                burst=max(1, global_budget_per_minute // 6))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.stats = {"pages": 0, "details": 0, "already_cached": 0, "over_budget": 0,
+                      "over_global_budget": 0, "errors": 0}
+
+    def _spend(self, user):
+        with self._budgets_lock:
+            bucket = self._budgets.get(user)
+            if bucket is None:
+                bucket = TokenBucket(self.budget_per_minute, burst=self.budget_per_minute)
+                self._budgets.set(user, bucket)
+        if bucket.try_acquire(0) is None:
+            self.stats["over_budget"] += 1
+            return False
+        if self._global_budget.try_acquire(0) is None:
+            self.stats["over_global_budget"] += 1
+            return False
+        return True
+
+    def _run(self, kind, fn, *args):
+        try:
+            fn(*args)
+            self.stats[kind] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error en precarga ({kind}) {args}: {e}")
+
+    def after_page(self, user, query, vendor, page_number, page_size, has_next, part_numbers):
+        """Programa la precarga tras servir `page_number`; no bloquea la respuesta."""
+        if not self.enabled:
+            return
+        trabajos = []
+        if has_next:
+            trabajos.append(("pages", self.page_fn, self.page_cached, (query, vendor, page_number + 1, page_size)))
+        for part_number in [pn for pn in part_numbers if pn][:self.top_cards]:
+            trabajos.append(("details", self.detail_fn, self.detail_cached, (part_number,)))
+
+        for kind, fn, cached, args in trabajos:
+            if cached(*args):
+                self.stats["already_cached"] += 1
+                continue
+            if not self._spend(user):
+                break
+            self._executor.submit(self._run, kind, fn, *args)
+
+    def snapshot(self):
+        return {"enabled": self.enabled, "users_tracked": len(self._budgets), **self.stats}
@@ -2,6 +2,7 @@ import os
 import requests
 import time
 from urllib.parse import quote
+from cache_store import PersistentImageCache
 
 class ProductImageService:
     """
@@ -15,8 +16,13 @@ class ProductImageService:
         self.serpapi_key = os.getenv("SERPAPI_KEY")
         self.bing_api_key = os.getenv("BING_IMAGE_API_KEY")
         
-        # Cache simple en memoria (en producción usar Redis)
-        self.image_cache = {}
+        # Cache persistente en disco con copia en memoria acotada (LRU + TTL)
+        self.image_cache = PersistentImageCache(
+            "product_images",
+            max_entries=int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", 20000)),
+            max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", 8)) * 1024 * 1024,
+            admission=True,
+        )
         
     def get_product_image(self, producto_nombre, marca="", sku=""):
         """
@@ -31,12 +37,13 @@ class ProductImageService:
             str: URL de la primera imagen encontrada o placeholder
         """
         
-        # Crear clave de caché
-        cache_key = f"{marca}_{producto_nombre}_{sku}".lower().replace(" ", "_")
+        # Crear clave de caché (el SKU identifica al producto; sin SKU, marca + nombre)
+        cache_key = self.cache_key(producto_nombre, marca, sku)
         
         # Verificar caché
-        if cache_key in self.image_cache:
-            return self.image_cache[cache_key]
+        cached_image = self.image_cache.get(cache_key)
+        if cached_image:
+            return cached_image
         
         # Limpiar y preparar términos de búsqueda
         search_terms = self._prepare_search_terms(producto_nombre, marca, sku)
@@ -48,27 +55,31 @@ class ProductImageService:
         if self.google_api_key and self.google_search_engine_id:
             image_url = self._search_google_images(search_terms)
             if image_url:
-                self.image_cache[cache_key] = image_url
+                self.image_cache.set(cache_key, image_url)
                 return image_url
         
         # 2. Intentar SerpApi
         if self.serpapi_key:
             image_url = self._search_serpapi_images(search_terms)
             if image_url:
-                self.image_cache[cache_key] = image_url
+                self.image_cache.set(cache_key, image_url)
                 return image_url
         
         # 3. Intentar Bing Images
         if self.bing_api_key:
             image_url = self._search_bing_images(search_terms)
             if image_url:
-                self.image_cache[cache_key] = image_url
+                self.image_cache.set(cache_key, image_url)
                 return image_url
         
         # 4. Fallback: placeholder
         placeholder = "https://via.placeholder.com/300x300/f8f9fa/6c757d?text=Sin+Imagen"
-        self.image_cache[cache_key] = placeholder
+        self.image_cache.set(cache_key, placeholder, placeholder=True)
         return placeholder
+
+    @staticmethod
+    def cache_key(producto_nombre, marca="", sku=""):
+        return sku if sku else f"{marca}_{producto_nombre}".lower().replace(" ", "_")
     
     def _prepare_search_terms(self, producto_nombre, marca, sku):
         """Prepara términos de búsqueda optimizados."""
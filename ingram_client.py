@@ -0,0 +1,460 @@
+import os
+import socket
+import threading
+import time
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import NewConnectionError
+from dotenv import load_dotenv
+from cache_store import SQLiteTokenBucket
+from resilience import CircuitBreaker, RateLimitExceeded, RateLimiter, TokenBucket, backoff_delay
+
+load_dotenv()
+
+INGRAM_BASE_URL = "https://api.ingrammicro.com"
+TOKEN_URL = f"{INGRAM_BASE_URL}/oauth/oauth20/token"
+PRICE_AVAILABILITY_URL = f"{INGRAM_BASE_URL}/resellers/v6/catalog/priceandavailability"
+
+# Familias de endpoints con circuit breaker propio
+ENDPOINT_FAMILIES = ("oauth", "catalog", "details", "pna")
+
+# Cuota saliente por familia (llamadas/minuto y por número de cliente), un poco bajo el límite de Ingram.
+# Es por host: los workers comparten el saldo en SQLite (SHARED_CACHE_PATH). Con varios hosts o
+# dynos, dividir estos valores entre su número. Con INGRAM_RATE_LIMIT_SHARED=false cada worker
+# usa buckets propios con la cuota dividida entre WEB_CONCURRENCY.
+RATE_LIMITS_PER_MINUTE = {
+    "oauth": int(os.getenv("INGRAM_RATE_LIMIT_OAUTH", 20)),
+    "catalog": int(os.getenv("INGRAM_RATE_LIMIT_CATALOG", 120)),
+    "details": int(os.getenv("INGRAM_RATE_LIMIT_DETAILS", 300)),
+    "pna": int(os.getenv("INGRAM_RATE_LIMIT_PNA", 120)),
+}
+
+INGRAM_RATE_LIMIT_SHARED = os.getenv("INGRAM_RATE_LIMIT_SHARED", "true").lower() != "false"
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+# Códigos que se reintentan (con backoff) en llamadas idempotentes
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# Tiempo total de una llamada lógica (intentos, esperas de turno y backoff incluidos),
+# por debajo del timeout de 30 s del router de Heroku
+INGRAM_CALL_DEADLINE = float(os.getenv("INGRAM_CALL_DEADLINE", 20))
+# Un read timeout significa que Ingram ya está procesando la petición: por defecto no se repite
+INGRAM_RETRY_READ_TIMEOUTS = os.getenv("INGRAM_RETRY_READ_TIMEOUTS", "false").lower() == "true"
+
+
+def request_not_sent(error):
+    """True si el error ocurrió antes de enviar la petición (no se pudo conectar)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def endpoint_family(url):
+    """Clasifica una URL de Ingram en su familia de endpoint."""
+    if "/oauth/" in url:
+        return "oauth"
+    if "priceandavailability" in url:
+        return "pna"
+    if "/catalog/details/" in url:
+        return "details"
+    return "catalog"
+
+
+def rate_bucket(key, rate_per_minute):
+    """Bucket del limitador saliente: compartido entre los workers del host o local con cuota dividida."""
+    if INGRAM_RATE_LIMIT_SHARED:
+        return SQLiteTokenBucket(key, rate_per_minute, workers=WEB_CONCURRENCY)
+    return TokenBucket(max(rate_per_minute / WEB_CONCURRENCY, 1))
+
+
+# Máximo de productos que Ingram acepta por petición de price & availability
+PRICE_AVAILABILITY_CHUNK_SIZE = int(os.getenv("INGRAM_PNA_CHUNK_SIZE", 50))
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    Adaptador HTTP que activa TCP keep-alive en los sockets del pool,
+    para que las conexiones ociosas hacia Ingram no sean cerradas por NAT/proxies.
+    """
+
+    def __init__(self, keep_alive_idle=60, **kwargs):
+        self.keep_alive_idle = keep_alive_idle
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        socket_options = list(HTTPConnection.default_socket_options)
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keep_alive_idle))
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 15))
+        kwargs["socket_options"] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+class TokenManager:
+    """
+    Administra el token OAuth de Ingram de forma segura entre hilos.
+
+    - Un solo hilo solicita el token nuevo (single-flight); los demás esperan su resultado.
+    - Refresca en segundo plano `refresh_margin` segundos antes de `expires_in`
+      (nunca antes de la mitad de la vida restante del token ni en menos de 1 s).
+    - Nunca entrega un token al que le queden menos de `safety_margin` segundos.
+    - Registra la latencia de cada refresco en `stats`.
+    """
+
+    def __init__(self, fetch_token, refresh_margin=None, safety_margin=None, retry_delay=30):
+        # fetch_token() -> (access_token, expires_in)
+        self._fetch_token = fetch_token
+        self.refresh_margin = refresh_margin if refresh_margin is not None else int(os.getenv("INGRAM_TOKEN_REFRESH_MARGIN", 300))
+        self.safety_margin = safety_margin if safety_margin is not None else int(os.getenv("INGRAM_TOKEN_SAFETY_MARGIN", 60))
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._token = None
+        self._expiry = 0.0  # reloj monotónico
+        self._timer = None
+        self._timer_pid = None
+
+        self.stats = {
+            "refreshes": 0,
+            "background_refreshes": 0,
+            "failures": 0,
+            "last_latency_ms": None,
+            "max_latency_ms": 0.0,
+            "last_refresh_at": None,
+        }
+
+    def _is_usable(self):
+        return self._token is not None and time.monotonic() < self._expiry - self.safety_margin
+
+    def get_token(self):
+        """Devuelve un token vigente; si no lo hay, solo un hilo lo renueva."""
+        if self._is_usable():
+            if self._timer_pid != os.getpid():
+                # El hilo del temporizador no sobrevive a un fork del worker
+                self._schedule_refresh()
+            return self._token
+
+        with self._lock:
+            # Otro hilo pudo renovarlo mientras esperábamos el lock
+            if self._is_usable():
+                return self._token
+            self._refresh_locked()
+            return self._token
+
+    def invalidate(self, token=None):
+        """
+        Descarta el token actual (por ejemplo tras un 401).
+        Con `token` solo lo descarta si sigue siendo el vigente: si otro hilo ya lo
+        renovó tras su propio 401, el token nuevo se conserva.
+        """
+        with self._lock:
+            if token is not None and token != self._token:
+                return
+            self._token = None
+            self._expiry = 0.0
+
+    def _refresh_locked(self, background=False):
+        """Solicita un token nuevo. Debe llamarse con el lock tomado."""
+        start = time.perf_counter()
+        try:
+            token, expires_in = self._fetch_token()
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        self._token = token
+        self._expiry = time.monotonic() + int(expires_in)
+
+        self.stats["refreshes"] += 1
+        if background:
+            self.stats["background_refreshes"] += 1
+        self.stats["last_latency_ms"] = round(latency_ms, 1)
+        self.stats["max_latency_ms"] = round(max(self.stats["max_latency_ms"], latency_ms), 1)
+        self.stats["last_refresh_at"] = time.time()
+        print(f"Token de Ingram renovado en {latency_ms:.0f} ms ({'segundo plano' if background else 'en línea'})")
+
+        self._schedule_refresh()
+
+    def _schedule_refresh(self, delay=None):
+        """Programa el refresco proactivo antes de que expire el token."""
+        if delay is None:
+            # Con tokens más cortos que el margen, refrescar a media vida y no en bucle
+            restante = self._expiry - time.monotonic()
+            delay = max(restante - self.refresh_margin, restante / 2, 1)
+        if self._timer is not None and self._timer_pid == os.getpid():
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer_pid = os.getpid()
+        self._timer.start()
+
+    def _background_refresh(self):
+        with self._lock:
+            try:
+                self._refresh_locked(background=True)
+            except Exception as e:
+                print(f"Error renovando token de Ingram en segundo plano: {e}")
+                # Reintentar mientras el token actual siga siendo usable
+                if self._is_usable():
+                    self._schedule_refresh(self.retry_delay)
+
+
+class IngramClient:
+    """
+    Cliente para la API de Ingram Micro con una sesión HTTP por worker.
+
+    Reutiliza conexiones TCP/TLS (keep-alive) mediante un pool configurable.
+    Los errores de conexión y los 5xx/429 de llamadas idempotentes se
+    reintentan con backoff exponencial y jitter, siempre dentro del plazo total
+    de la llamada (`call_deadline`). Cada familia de endpoints tiene su propio
+    circuit breaker y todas las llamadas pasan por un limitador de tasa por
+    familia y número de cliente.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, pool_connections=None,
+                 pool_maxsize=None, max_retries=None, backoff_factor=None,
+                 timeout=None, keep_alive=None, call_deadline=None, retry_read_timeouts=None):
+        self.client_id = client_id or os.getenv("INGRAM_CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("INGRAM_CLIENT_SECRET")
+
+        # Configuración del pool (sobrescribible por variables de entorno)
+        self.pool_connections = pool_connections or int(os.getenv("INGRAM_POOL_CONNECTIONS", 4))
+        self.pool_maxsize = pool_maxsize or int(os.getenv("INGRAM_POOL_SIZE", 20))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("INGRAM_MAX_RETRIES", 3))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("INGRAM_BACKOFF_FACTOR", 0.3))
+        self.timeout = timeout or (
+            float(os.getenv("INGRAM_CONNECT_TIMEOUT", 3.05)),
+            float(os.getenv("INGRAM_READ_TIMEOUT", 20)),
+        )
+        if keep_alive is None:
+            keep_alive = os.getenv("INGRAM_KEEP_ALIVE", "true").lower() != "false"
+        self.keep_alive = keep_alive
+        self.call_deadline = call_deadline or INGRAM_CALL_DEADLINE
+        self.retry_read_timeouts = INGRAM_RETRY_READ_TIMEOUTS if retry_read_timeouts is None else retry_read_timeouts
+
+        # Circuit breakers por familia de endpoint
+        self.breakers = {
+            family: CircuitBreaker(
+                family,
+                failure_threshold=int(os.getenv("INGRAM_BREAKER_THRESHOLD", 5)),
+                recovery_timeout=float(os.getenv("INGRAM_BREAKER_RECOVERY", 30)),
+            )
+            for family in ENDPOINT_FAMILIES
+        }
+        self.retry_backoff_cap = float(os.getenv("INGRAM_RETRY_BACKOFF_CAP", 4))
+
+        # Limitador de tasa saliente (espera acotada o rechazo inmediato)
+        self.rate_limiter = RateLimiter(
+            RATE_LIMITS_PER_MINUTE,
+            max_wait=float(os.getenv("INGRAM_RATE_LIMIT_MAX_WAIT", 2)),
+            bucket_factory=rate_bucket,
+        )
+
+        # Token OAuth compartido por todos los hilos del worker
+        self.tokens = TokenManager(self._request_token)
+
+        # La sesión se crea de forma perezosa y se recrea si el proceso hace fork
+        self._session = None
+        self._session_pid = None
+
+    @property
+    def session(self):
+        """Sesión HTTP del worker actual (una por proceso)."""
+        if self._session is None or self._session_pid != os.getpid():
+            self._session = self._build_session()
+            self._session_pid = os.getpid()
+        return self._session
+
+    def _build_session(self):
+        """Crea la sesión con pool de conexiones."""
+        # Sin reintentos en el adaptador: todos se hacen en request(), dentro del plazo
+        # de la llamada y a la vista del circuit breaker.
+        adapter = KeepAliveAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Connection"] = "keep-alive" if self.keep_alive else "close"
+        return session
+
+    def _request_token(self):
+        """Solicita un token nuevo al endpoint OAuth de Ingram."""
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret
+        }
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        res = self.request("POST", TOKEN_URL, data=data, headers=headers, idempotent=False)
+        res.raise_for_status()
+        token_data = res.json()
+        return token_data["access_token"], int(token_data.get("expires_in", 86399))
+
+    def get_token(self):
+        """Obtiene y refresca el token de Ingram (cached)."""
+        return self.tokens.get_token()
+
+    def token_stats(self):
+        """Métricas de refresco del token (latencia, conteos, fallos)."""
+        return dict(self.tokens.stats)
+
+    def headers(self):
+        """Construye headers requeridos por Ingram."""
+        correlation_id = str(uuid.uuid4()).replace("-", "")[:32]
+        return {
+            "Authorization": f"Bearer {self.get_token()}",
+            "IM-CustomerNumber": os.getenv("INGRAM_CUSTOMER_NUMBER"),
+            "IM-SenderID": os.getenv("INGRAM_SENDER_ID"),
+            "IM-CorrelationID": correlation_id,
+            "IM-CountryCode": os.getenv("INGRAM_COUNTRY_CODE"),
+            "Accept-Language": os.getenv("INGRAM_LANGUAGE", "es-MX"),
+            "Content-Type": "application/json"
+        }
+
+    def request(self, method, url, idempotent=None, deadline=None, **kwargs):
+        """
+        Ejecuta una petición usando la sesión del pool.
+        Acepta URL completa o ruta relativa a INGRAM_BASE_URL.
+
+        Pasa por el limitador de tasa (lanza RateLimitExceeded si no hay turno
+        dentro de la espera permitida) y por el circuit breaker de su familia
+        (lanza CircuitOpenError si está abierto). Los errores de conexión se
+        reintentan siempre (la petición no llegó a enviarse); las llamadas
+        idempotentes (GET y price & availability, que es POST de solo lectura)
+        también ante 5xx/429 y errores de red, salvo read timeouts.
+
+        `deadline` (segundos, por defecto `call_deadline`) acota la llamada
+        completa: cada intento recibe como timeout lo que queda del plazo y no
+        se reintenta si el backoff no cabe. El breaker cuenta un solo éxito o
+        fallo por llamada, según el resultado del último intento.
+
+        Un 401 con token Bearer (revocado o vencido antes de tiempo) invalida el
+        token y repite la llamada una sola vez con uno nuevo, dentro del mismo plazo.
+        """
+        if url.startswith("/"):
+            url = f"{INGRAM_BASE_URL}{url}"
+        if "headers" not in kwargs:
+            kwargs["headers"] = self.headers()
+        limite = time.monotonic() + (deadline or self.call_deadline)
+
+        res = self._send(method, url, idempotent, limite, kwargs)
+        autorizacion = kwargs["headers"].get("Authorization") or ""
+        if res.status_code == 401 and autorizacion.startswith("Bearer ") and time.monotonic() < limite:
+            self.tokens.invalidate(autorizacion[len("Bearer "):])
+            kwargs["headers"] = {**kwargs["headers"], "Authorization": f"Bearer {self.get_token()}"}
+            res = self._send(method, url, idempotent, limite, kwargs)
+        return res
+
+    def _send(self, method, url, idempotent, limite, kwargs):
+        """Intentos de una llamada con reintentos, limitador y breaker (ver request())."""
+        kwargs = dict(kwargs)
+        timeout = kwargs.pop("timeout", self.timeout)
+        family = endpoint_family(url)
+        breaker = self.breakers[family]
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD") or family == "pna"
+        customer = kwargs["headers"].get("IM-CustomerNumber") or os.getenv("INGRAM_CUSTOMER_NUMBER", "")
+
+        self.rate_limiter.acquire(family, customer, max_wait=self._turn_wait(limite))
+        breaker.before_call()
+        res = error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                try:
+                    self.rate_limiter.acquire(family, customer, max_wait=self._turn_wait(limite))
+                except RateLimitExceeded:
+                    break
+            restante = max(limite - time.monotonic(), 0.1)
+            kwargs["timeout"] = tuple(min(t, restante) for t in timeout) \
+                if isinstance(timeout, tuple) else min(timeout, restante)
+            try:
+                res, error = self.session.request(method, url, **kwargs), None
+            except requests.RequestException as e:
+                res, error = None, e
+                if not self._retryable_error(e, idempotent):
+                    break
+            else:
+                if not idempotent or res.status_code not in RETRYABLE_STATUS:
+                    break
+            pausa = backoff_delay(attempt, base=self.backoff_factor, cap=self.retry_backoff_cap)
+            if attempt >= self.max_retries or time.monotonic() + pausa >= limite:
+                break
+            time.sleep(pausa)
+
+        if error is not None or res.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if error is not None:
+            raise error
+        return res
+
+    def _turn_wait(self, limite):
+        """Espera máxima por turno del limitador sin pasarse del plazo de la llamada."""
+        return max(min(self.rate_limiter.max_wait, limite - time.monotonic()), 0.0)
+
+    def _retryable_error(self, error, idempotent):
+        if request_not_sent(error):
+            return True
+        if isinstance(error, requests.ReadTimeout):
+            return idempotent and self.retry_read_timeouts
+        return idempotent and isinstance(error, requests.ConnectionError)
+
+    def rate_limit_stats(self):
+        """Esperas y rechazos del limitador de tasa."""
+        return dict(self.rate_limiter.stats)
+
+    def breaker_stats(self):
+        """Estado de los circuit breakers por familia de endpoint."""
+        return {family: breaker.snapshot() for family, breaker in self.breakers.items()}
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def price_and_availability(self, part_numbers, chunk_size=PRICE_AVAILABILITY_CHUNK_SIZE, deadline=None):
+        """
+        Consulta precio y disponibilidad de varios ingramPartNumber en una sola petición
+        (o en bloques de `chunk_size` si la lista excede el límite de Ingram).
+        Devuelve la lista de resultados de Ingram; los bloques con respuesta distinta de 200 se omiten.
+        Con `deadline` (segundos) todos los bloques comparten el plazo; los que no caben se omiten.
+        """
+        part_numbers = [pn for pn in dict.fromkeys(part_numbers) if pn]
+        params = {
+            "includeAvailability": "true",
+            "includePricing": "true",
+            "includeProductAttributes": "true"
+        }
+
+        limite = time.monotonic() + deadline if deadline else None
+        resultados = []
+        for i in range(0, len(part_numbers), chunk_size):
+            restante = limite - time.monotonic() if limite else None
+            if restante is not None and restante <= 0:
+                break
+            bloque = part_numbers[i:i + chunk_size]
+            body = {"products": [{"ingramPartNumber": pn} for pn in bloque]}
+            res = self.post(PRICE_AVAILABILITY_URL, params=params, json=body, deadline=restante)
+            if res.status_code != 200:
+                continue
+            data = res.json()
+            if isinstance(data, dict):
+                resultados.append(data)
+            elif isinstance(data, list):
+                resultados.extend(data)
+        return resultados
+
+
+# Instancia global del cliente (una sesión por worker)
+ingram_client = IngramClient()
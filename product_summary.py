@@ -0,0 +1,173 @@
+import os
+
+# Longitud máxima del título de la tarjeta (el CSS muestra dos líneas)
+CARD_TITLE_MAX_CHARS = int(os.getenv("CARD_TITLE_MAX_CHARS", 120))
+# Margen de utilidad sobre el precio de Ingram que se muestra en el catálogo
+PRICE_MARKUP = 1.10
+
+
+def truncate_label(text, length, end="...", leeway=5):
+    """Igual que el filtro truncate de Jinja: corta en palabra y tolera `leeway` caracteres de más."""
+    if len(text) <= length + leeway:
+        return text
+    return text[:length - len(end)].rsplit(" ", 1)[0] + end
+
+
+def card_price_fields(info, availability_text):
+    """
+    Campos de la tarjeta que dependen del nivel de precios: (precio, etiqueta de
+    disponibilidad, insignia). Se calculan una vez por respuesta de price & availability.
+    """
+    pricing = info.get("pricing") or {}
+    price = pricing.get("customerPrice")
+    if price:
+        price_label = f"{pricing.get('currencyCode', '')} ${round(float(price) * PRICE_MARKUP, 2)}"
+    else:
+        price_label = "Consultar precio"
+    show_badge = bool(info.get("availability"))
+    availability_label = truncate_label(availability_text or "", 20) if show_badge else None
+    return price_label, availability_label, show_badge
+
+
+class ProductSummary:
+    """
+    Proyección compacta de un producto de Ingram con solo los campos que usan
+    las tarjetas del catálogo. Se construye una vez al ingerir la respuesta
+    (from_ingram) y es lo que guardan las cachés de catálogo.
+
+    Incluye el view-model de la tarjeta ya calculado (imagen resuelta, título y
+    marca, precio con margen, etiqueta de disponibilidad e insignia), de modo
+    que la plantilla solo interpola. `image_url` es None si solo hay placeholder;
+    la imagen se completa al servir con with_image().
+
+    Los metadatos cambian poco; precio y existencias vienen del nivel de
+    precios y se agregan con with_price(), que devuelve una copia.
+    El JSON completo solo se conserva en la caché de detalle (product_cache).
+    """
+
+    __slots__ = (
+        "ingram_part_number", "vendor_part_number", "description", "vendor_name",
+        "category", "sub_category", "image_url",
+        "customer_price", "currency_code", "availability", "status_code", "status_message",
+        "card_title", "card_brand", "price_label", "availability_label", "show_badge",
+    )
+
+    # Nombre del campo en el JSON de Ingram -> atributo
+    INGRAM_FIELDS = {
+        "ingramPartNumber": "ingram_part_number",
+        "vendorPartNumber": "vendor_part_number",
+        "description": "description",
+        "vendorName": "vendor_name",
+        "category": "category",
+        "subCategory": "sub_category",
+        "availability": "availability",
+        "productStatusCode": "status_code",
+        "productStatusMessage": "status_message",
+    }
+
+    def __init__(self, ingram_part_number="", vendor_part_number="", description="", vendor_name="",
+                 category="", sub_category="", image_url=None, customer_price=None, currency_code="",
+                 availability=None, status_code=None, status_message=None, card_title=None, card_brand=None,
+                 price_label="Consultar precio", availability_label=None, show_badge=False):
+        self.ingram_part_number = ingram_part_number
+        self.vendor_part_number = vendor_part_number
+        self.description = description
+        self.vendor_name = vendor_name
+        self.category = category
+        self.sub_category = sub_category
+        self.image_url = image_url
+        self.customer_price = customer_price
+        self.currency_code = currency_code
+        self.availability = availability
+        self.status_code = status_code
+        self.status_message = status_message
+        self.card_title = card_title
+        self.card_brand = card_brand
+        self.price_label = price_label
+        self.availability_label = availability_label
+        self.show_badge = show_badge
+
+    @classmethod
+    def from_ingram(cls, item, image_url=None):
+        """
+        Proyecta los metadatos de un producto del catálogo (sin precio ni existencias).
+        `image_url` es la imagen ya resuelta para la tarjeta; sin ella se usa la de Ingram.
+        """
+        if image_url is None:
+            imgs = item.get("productImages") or item.get("productImageList") or []
+            if isinstance(imgs, list) and imgs and isinstance(imgs[0], dict):
+                image_url = imgs[0].get("url") or imgs[0].get("imageUrl") or imgs[0].get("imageURL")
+        description = item.get("description") or ""
+        vendor_name = item.get("vendorName") or ""
+        return cls(
+            ingram_part_number=item.get("ingramPartNumber") or "",
+            vendor_part_number=item.get("vendorPartNumber") or "",
+            description=description,
+            vendor_name=vendor_name,
+            category=item.get("category") or "",
+            sub_category=item.get("subCategory") or "",
+            image_url=image_url,
+            card_title=truncate_label(description or "Sin descripción", CARD_TITLE_MAX_CHARS),
+            card_brand=vendor_name or "Marca no disponible",
+        )
+
+    def with_price(self, info, card_fields):
+        """
+        Copia con precio y existencias tomados de una respuesta de price & availability;
+        `card_fields` son los campos ya calculados por card_price_fields().
+        """
+        copia = ProductSummary(*(getattr(self, slot) for slot in self.__slots__))
+        pricing = info.get("pricing") or {}
+        copia.customer_price = pricing.get("customerPrice")
+        copia.currency_code = pricing.get("currencyCode") or ""
+        copia.availability = _project_availability(info.get("availability"))
+        copia.status_code = info.get("productStatusCode")
+        copia.status_message = info.get("productStatusMessage")
+        copia.price_label, copia.availability_label, copia.show_badge = card_fields
+        return copia
+
+    def with_image(self, image_url):
+        """Copia con la imagen de la tarjeta indicada."""
+        copia = ProductSummary(*(getattr(self, slot) for slot in self.__slots__))
+        copia.image_url = image_url
+        return copia
+
+    def get(self, key, default=None):
+        """Acceso por nombre de campo de Ingram, para las funciones que reciben el JSON original."""
+        if key in ("productImages", "productImageList"):
+            value = [{"url": self.image_url}] if self.image_url else None
+        elif key == "pricing":
+            value = {"customerPrice": self.customer_price, "currencyCode": self.currency_code} \
+                if self.customer_price is not None else None
+        else:
+            attr = self.INGRAM_FIELDS.get(key)
+            value = getattr(self, attr) if attr else None
+        return default if value is None else value
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __eq__(self, other):
+        return isinstance(other, ProductSummary) and self.__getstate__() == other.__getstate__()
+
+    def __repr__(self):
+        return f"ProductSummary({self.ingram_part_number!r}, {self.description[:40]!r})"
+
+
+def _project_availability(av):
+    """Solo lo que se muestra: total, bandera y almacenes con existencias."""
+    if not isinstance(av, dict) or not av:
+        return None
+    return {
+        "available": av.get("available"),
+        "totalAvailability": av.get("totalAvailability"),
+        "availabilityByWarehouse": [
+            {k: w.get(k) for k in ("location", "warehouseName", "warehouseId", "quantityAvailable")}
+            for w in av.get("availabilityByWarehouse") or []
+            if int(w.get("quantityAvailable", 0) or 0) > 0
+        ],
+    }
@@ -0,0 +1,93 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Alias frecuentes de marcas -> nombre de marca tal como lo usa Ingram
+VENDOR_ALIASES = {
+    "hp": "HP Cómputo",
+    "hp computo": "HP Cómputo",
+    "hp impresion": "HP Impresión",
+    "hpe": "Hewlett Packard Enterprise",
+    "hewlett packard": "Hewlett Packard Enterprise",
+    "aruba": "HPE ARUBA NETWORKING",
+    "startech": "StarTech.com",
+    "tplink": "TP-Link",
+    "tp link": "TP-Link",
+    "cyber power": "CyberPower",
+    "msi": "Msi Componentes",
+    "zebra technologies": "Zebra Tech.",
+    "todas las marcas": "",
+}
+
+
+def fold_text(text):
+    """Minúsculas (casefold), sin acentos y con espacios colapsados."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def canonicalize_query(query):
+    """Forma canónica de una búsqueda de texto (se usa para la clave de caché y para Ingram)."""
+    return fold_text(query)
+
+
+def canonicalize_vendor(vendor, known_vendors=()):
+    """
+    Resuelve una marca a su nombre canónico de Ingram: primero por alias,
+    luego por coincidencia sin mayúsculas/acentos con las marcas conocidas.
+    """
+    folded = fold_text(vendor)
+    if not folded:
+        return ""
+    if folded in VENDOR_ALIASES:
+        return VENDOR_ALIASES[folded]
+    for known in known_vendors:
+        if fold_text(known) == folded:
+            return known
+    return re.sub(r"\s+", " ", vendor).strip()
+
+
+class CanonicalKeyStats:
+    """
+    Mide cuánto sube la tasa de aciertos gracias a la canonicalización.
+
+    Un acierto "ganado" es uno cuya clave cruda (sin normalizar) nunca se había
+    visto en este worker: con claves crudas habría sido un fallo de caché.
+    """
+
+    def __init__(self, max_tracked_keys=50000):
+        self.max_tracked_keys = max_tracked_keys
+        self._raw_keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.hits_gained = 0
+
+    def record(self, raw_key, canonical_key, hit):
+        with self._lock:
+            self.lookups += 1
+            seen = raw_key in self._raw_keys
+            if seen:
+                self._raw_keys.move_to_end(raw_key)
+            else:
+                self._raw_keys[raw_key] = True
+                if len(self._raw_keys) > self.max_tracked_keys:
+                    self._raw_keys.popitem(last=False)
+            if hit:
+                self.hits += 1
+                if not seen and raw_key != canonical_key:
+                    self.hits_gained += 1
+
+    def snapshot(self):
+        lookups = self.lookups or 1
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hits_gained_by_canonicalization": self.hits_gained,
+            "hit_rate": round(self.hits / lookups, 4),
+            "hit_rate_raw_keys_estimate": round((self.hits - self.hits_gained) / lookups, 4),
+        }
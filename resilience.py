@@ -0,0 +1,187 @@
+import random
+import threading
+import time
+
+
+class UpstreamUnavailable(Exception):
+    """Base de los rechazos locales (sin salir a la red) hacia un servicio externo."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """Se lanza cuando el circuito de un endpoint está abierto y la llamada se rechaza sin salir a la red."""
+
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"Circuito '{name}' abierto; reintentar en {retry_in:.1f}s")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por endpoint (closed -> open -> half-open).
+
+    - closed: las llamadas pasan; `failure_threshold` fallos consecutivos abren el circuito.
+    - open: las llamadas fallan de inmediato durante `recovery_timeout` segundos.
+    - half-open: se permiten hasta `half_open_max_calls` llamadas de prueba;
+      un éxito cierra el circuito y un fallo lo vuelve a abrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        self.stats = {"failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def _update_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+
+    def before_call(self):
+        """Reserva permiso para llamar; lanza CircuitOpenError si el circuito no lo permite."""
+        with self._lock:
+            self._update_state()
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return
+            self.stats["rejected"] += 1
+            retry_in = max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0)
+            raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self.stats["failures"] += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.stats["opened"] += 1
+                    print(f"Circuito '{self.name}' abierto tras {self._failures} fallos")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        return {"state": self.state, "consecutive_failures": self._failures, **self.stats}
+
+
+def backoff_delay(attempt, base=0.25, cap=4.0):
+    """Backoff exponencial con jitter completo: uniforme en [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RateLimitExceeded(UpstreamUnavailable):
+    """Se lanza cuando el limitador local no concede turno dentro de la espera permitida."""
+
+    def __init__(self, key, wait):
+        self.key = key
+        self.wait = wait
+        super().__init__(f"Límite de tasa '{key}' alcanzado; turno disponible en {wait:.1f}s")
+
+
+class TokenBucket:
+    """
+    Token bucket seguro entre hilos.
+
+    Se recarga a `rate_per_minute` tokens por minuto hasta `burst`. Un llamador que
+    no encuentra token reserva el siguiente y espera su turno, siempre que la espera
+    no supere `max_wait`; si la supera, se rechaza sin consumir nada.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, rate_per_minute // 6))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, max_wait=0.0):
+        """Devuelve el tiempo que hubo que esperar, o None si la espera excedía `max_wait`."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            wait = (1 - self._tokens) / self.rate
+            if wait > max_wait:
+                return None
+            # Reservar el token (saldo negativo) y esperar fuera del lock
+            self._tokens -= 1
+        time.sleep(wait)
+        return wait
+
+    def next_available_in(self):
+        with self._lock:
+            self._refill()
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Conjunto de token buckets por (familia de endpoint, número de cliente).
+    Los límites por familia se expresan en llamadas por minuto. `bucket_factory(key,
+    rate_per_minute)` permite usar otros buckets (por ejemplo, compartidos entre
+    procesos o con la cuota repartida entre workers); por defecto, TokenBucket.
+    """
+
+    def __init__(self, limits_per_minute, default_per_minute=120, max_wait=2.0, bucket_factory=None):
+        self.limits_per_minute = dict(limits_per_minute)
+        self.default_per_minute = default_per_minute
+        self.max_wait = max_wait
+        self.bucket_factory = bucket_factory
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.stats = {"waited": 0, "rejected": 0}
+
+    def _bucket(self, family, customer):
+        key = (family, customer)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    rate = self.limits_per_minute.get(family, self.default_per_minute)
+                    bucket = self.bucket_factory(f"{family}:{customer}", rate) if self.bucket_factory \
+                        else TokenBucket(rate)
+                    self._buckets[key] = bucket
+        return bucket
+
+    def acquire(self, family, customer="", max_wait=None):
+        """Espera turno (como máximo `max_wait` s) o lanza RateLimitExceeded."""
+        if max_wait is None:
+            max_wait = self.max_wait
+        bucket = self._bucket(family, customer)
+        waited = bucket.try_acquire(max_wait)
+        if waited is None:
+            self.stats["rejected"] += 1
+            raise RateLimitExceeded(f"{family}:{customer}", bucket.next_available_in())
+        if waited:
+            self.stats["waited"] += 1
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Los almacenes en disco van a un directorio privado temporal, no al del usuario,
+# y los módulos de la app no lanzan el precalentamiento al importarse
+os.environ.setdefault("CACHE_DATA_DIR", tempfile.mkdtemp(prefix="ingram-tests-"))
+os.environ.setdefault("WARM_ENABLED", "false")
+
+import cache_store  # noqa: E402
+import resilience  # noqa: E402
+
+
+class FakeClock:
+    """Reloj monotónico controlable; sleep() avanza el reloj sin esperar."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=fake.monotonic, sleep=fake.sleep))
+    # El hilo de barrido de cache_store conserva el sleep real para no girar en vacío
+    monkeypatch.setattr(cache_store, "time", SimpleNamespace(monotonic=fake.monotonic, time=time.time,
+                                                             sleep=time.sleep))
+    return fake
@@ -0,0 +1,163 @@
+import json
+import os
+import time
+
+import pytest
+import requests
+
+import appv5
+
+CATALOG = [
+    {"ingramPartNumber": "ABC123", "vendorPartNumber": "VP-ABC", "description": "Laptop HP 14",
+     "vendorName": "HP", "category": "Laptop", "productImages": [{"url": "https://img.example/abc.jpg"}]},
+    {"ingramPartNumber": "XYZ9", "vendorPartNumber": "VP-XYZ", "description": "Monitor Dell 24",
+     "vendorName": "Dell", "category": "Monitor", "productImages": [{"url": "https://img.example/xyz.jpg"}]},
+]
+
+CACHES = [appv5.search_cache, appv5.catalog_store, appv5.product_cache, appv5.price_cache,
+          appv5.missing_sku_cache, appv5.empty_search_cache, appv5.image_cache]
+
+
+def respuesta(status, data=None):
+    res = requests.Response()
+    res.status_code = status
+    res._content = json.dumps(data).encode("utf-8") if data is not None else b""
+    return res
+
+
+class FakeIngram:
+    """Sesión HTTP simulada de Ingram: OAuth, búsqueda de catálogo y price & availability."""
+
+    def __init__(self):
+        self.calls = []
+        self.catalog_status = 200
+        self.catalog = CATALOG
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs.get("params")))
+        if "/oauth/" in url:
+            return respuesta(200, {"access_token": "token", "expires_in": 86399})
+        if url.endswith("priceandavailability"):
+            return respuesta(200, [
+                {"ingramPartNumber": p["ingramPartNumber"], "productStatusCode": "E"}
+                for p in kwargs["json"]["products"]
+            ])
+        if url.endswith("/catalog"):
+            if self.catalog_status != 200:
+                return respuesta(self.catalog_status, {"errors": []})
+            return respuesta(200, {"catalog": self.catalog, "recordsFound": len(self.catalog)})
+        return respuesta(404, {})
+
+    def catalog_calls(self):
+        return [params for _, url, params in self.calls if url.endswith("/catalog")]
+
+
+@pytest.fixture
+def ingram(monkeypatch):
+    fake = FakeIngram()
+    monkeypatch.setattr(appv5.ingram_client, "_session", fake)
+    monkeypatch.setattr(appv5.ingram_client, "_session_pid", os.getpid())
+    # Sin reintentos ni backoff: cada llamada lógica es un solo intento
+    monkeypatch.setattr(appv5.ingram_client, "max_retries", 0)
+    for cache in CACHES:
+        cache.clear()
+    yield fake
+    for breaker in appv5.ingram_client.breakers.values():
+        breaker.record_success()
+
+
+@pytest.mark.parametrize("status", [401, 403, 429, 500, 503])
+def test_catalog_errors_raise_instead_of_empty_page(ingram, status):
+    ingram.catalog_status = status
+    with pytest.raises(appv5.UpstreamUnavailable):
+        appv5.buscar_en_catalogo_general("laptop")
+    assert appv5.empty_search_cache.get("laptop_") is None
+
+
+def test_catalog_error_is_not_cached(ingram):
+    ingram.catalog_status = 429
+    assert appv5.buscar_productos_hibrido("laptop") == ([], 0, True)
+    assert appv5.search_cache.get("laptop__1_25") is None
+    ingram.catalog_status = 200
+    productos, total, pagina_vacia = appv5.buscar_productos_hibrido("laptop")
+    assert [p.ingram_part_number for p in productos] == ["ABC123", "XYZ9"]
+    assert total == 2
+    assert not pagina_vacia
+
+
+def test_empty_page_uses_negative_ttl(ingram, monkeypatch):
+    ingram.catalog = []
+    ttls = []
+    set_original = appv5.search_cache.set
+    monkeypatch.setattr(appv5.search_cache, "set", lambda key, value, ttl=None: (
+        ttls.append(ttl), set_original(key, value, ttl=ttl))[1])
+    assert appv5.buscar_productos_hibrido("sin resultados") == ([], 0, True)
+
+    negative_ttl = appv5.NEGATIVE_CACHE_TTL_MINUTES * 60
+    assert ttls == [negative_ttl]
+    entrada = appv5.search_cache.get("sin resultados__1_25")
+    assert entrada["soft_expiry"] == entrada["hard_expiry"]
+    assert entrada["hard_expiry"] - time.time() == pytest.approx(negative_ttl, abs=5)
+
+
+def test_page_with_results_keeps_search_ttls(ingram):
+    appv5.buscar_productos_hibrido("laptop")
+    entrada = appv5.search_cache.get("laptop__1_25")
+    assert entrada["data"]["part_numbers"] == ["ABC123", "XYZ9"]
+    assert entrada["soft_expiry"] - time.time() == pytest.approx(appv5.CACHE_EXPIRY_HOURS * 3600, abs=5)
+    assert entrada["hard_expiry"] - time.time() == pytest.approx(appv5.CACHE_HARD_EXPIRY_HOURS * 3600, abs=5)
+
+
+def test_equivalent_queries_share_one_catalog_call(ingram):
+    for query in ["HP  Laptop", "hp laptop", "Hp Laptop "]:
+        productos, _, _ = appv5.buscar_productos_hibrido(query)
+        assert [p.ingram_part_number for p in productos] == ["ABC123", "XYZ9"]
+    assert len(ingram.catalog_calls()) == 1
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(appv5, "ADMIN_PURGE_TOKEN", "secreto")
+    return appv5.app.test_client()
+
+
+def test_cache_stats_requires_admin_token(admin):
+    assert admin.get("/api/cache-stats").status_code == 403
+    assert admin.get("/api/cache-stats", headers={"X-Admin-Token": "otro"}).status_code == 403
+    res = admin.get("/api/cache-stats", headers={"X-Admin-Token": "secreto"})
+    assert res.status_code == 200
+    assert "search" in res.get_json()["caches"]
+
+
+def test_cache_stats_is_closed_without_configured_token(monkeypatch):
+    monkeypatch.setattr(appv5, "ADMIN_PURGE_TOKEN", None)
+    res = appv5.app.test_client().get("/api/cache-stats", headers={"X-Admin-Token": ""})
+    assert res.status_code == 403
+
+
+def test_purge_sku_reports_each_store(ingram, admin):
+    appv5.buscar_productos_hibrido("laptop")
+    res = admin.post("/admin/cache/purge", json={"scope": "sku", "value": "abc123"},
+                     headers={"X-Admin-Token": "secreto"})
+    deleted = res.get_json()["deleted"]
+    assert deleted["catalog_products"] == {"local": 1, "shared": 1}
+    assert deleted["search"] == {"local": 1, "shared": 1}
+    assert appv5.catalog_store.get("XYZ9") is not None
+
+
+def test_purge_all_clears_catalog_caches(ingram, admin):
+    appv5.buscar_productos_hibrido("laptop")
+    res = admin.post("/admin/cache/purge", json={"scope": "all"}, headers={"X-Admin-Token": "secreto"})
+    deleted = res.get_json()["deleted"]
+    assert deleted["catalog_products"] == {"local": 2, "shared": 2}
+    assert deleted["search"] == {"local": 1, "shared": 1}
+    assert appv5.search_cache.get("laptop__1_25") is None
+    assert appv5.catalog_store.get("ABC123") is None
+
+
+def test_invalidation_from_other_worker_only_drops_local_copies(ingram):
+    appv5.buscar_productos_hibrido("laptop")
+    eliminadas = appv5.aplicar_invalidacion("all", "", local_only=True)
+    assert eliminadas["search"] == {"local": 1}
+    # El almacén compartido lo purga quien publica la invalidación
+    assert appv5.search_cache.get("laptop__1_25") is not None
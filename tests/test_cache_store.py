@@ -0,0 +1,373 @@
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+
+import pytest
+
+from cache_store import FrequencySketch, InvalidationBus, LRUTTLCache, PersistentImageCache, SharedCache, \
+    SingleFlight, SQLiteCacheBackend, SQLiteTokenBucket, TinyLFUAdmission, connect_private_db, pack_value, \
+    stable_key, unpack_value
+
+
+def make_cache(**kwargs):
+    kwargs.setdefault("sizeof", lambda value: 1)
+    return LRUTTLCache("test", **kwargs)
+
+
+def wait_until(predicate, timeout=5):
+    """Sondea `predicate` hasta que se cumpla o venza el plazo."""
+    limite = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < limite, "la condición no se cumplió a tiempo"
+        time.sleep(0.001)
+
+
+def test_lru_evicts_least_recently_used_entry(clock):
+    cache = make_cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" pasa a ser la menos reciente
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats["evictions"] == 1
+
+
+def test_lru_respects_byte_budget(clock):
+    cache = make_cache(max_entries=100, max_bytes=10, sizeof=len)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+    assert cache.set("big", "z" * 11) is False
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = make_cache(default_ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=10)
+    clock.advance(11)
+    assert cache.get("b") is None
+    clock.advance(48)
+    assert cache.get("a") == 1
+    clock.advance(2)
+    assert cache.get("a") is None
+
+
+def test_stale_reads_within_grace_period(clock):
+    cache = make_cache(default_ttl=60, stale_grace=30)
+    cache.set("a", 1)
+    clock.advance(70)
+    assert cache.get("a") is None
+    assert cache.get("a", allow_stale=True) == 1
+    clock.advance(30)
+    assert cache.get("a", allow_stale=True) is None
+
+
+def test_sweep_drops_entries_past_grace(clock):
+    cache = make_cache(default_ttl=60, stale_grace=30)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=600)
+    clock.advance(95)
+    cache.sweep()
+    assert len(cache) == 1
+    assert cache.get("b") == 2
+
+
+def test_pack_value_compresses_large_values():
+    pequeño = {"sku": "ABC123"}
+    grande = {"items": [{"sku": f"SKU{i}", "description": "Laptop HP 14"} for i in range(200)]}
+    assert pack_value(pequeño)[:1] == b"P"
+    assert pack_value(grande)[:1] == b"Z"
+    assert len(pack_value(grande)) < len(pickle.dumps(grande)) / 3
+    assert unpack_value(pack_value(pequeño)) == pequeño
+    assert unpack_value(memoryview(pack_value(grande))) == grande
+    with pytest.raises(ValueError):
+        unpack_value(pickle.dumps(pequeño))
+
+
+def test_compressed_cache_returns_copies(clock):
+    cache = make_cache(compress=True)
+    cache.set("a", {"items": [1, 2]})
+    copia = cache.get("a")
+    copia["items"].append(3)
+    assert cache.get("a") == {"items": [1, 2]}
+
+
+def test_compressed_cache_charges_packed_size(clock):
+    cache = make_cache(compress=True)
+    cache.set("a", ["x" * 100] * 100)
+    assert cache.snapshot()["bytes"] == len(pack_value(["x" * 100] * 100))
+
+
+def test_frequency_sketch_halves_counters_after_sample():
+    sketch = FrequencySketch(width=64, sample_size=100)
+    for _ in range(10):
+        sketch.increment("popular")
+    assert sketch.estimate("popular") >= 10
+    for i in range(90):
+        sketch.increment(f"otra{i}")
+    assert sketch.resets == 1
+    assert 5 <= sketch.estimate("popular") < 10
+
+
+def test_tinylfu_admits_only_more_frequent_candidates():
+    admission = TinyLFUAdmission(max_entries=1000)
+    for _ in range(5):
+        admission.record("popular")
+    admission.record("nueva")
+    assert admission.admit("popular", "nueva")
+    assert not admission.admit("nueva", "popular")
+    assert admission.stats == {"admitted": 1, "rejected": 1}
+
+
+def test_cache_with_admission_protects_frequent_entries(clock):
+    cache = make_cache(max_entries=64, admission=True)
+    claves = [f"k{i}" for i in range(64)]
+    for key in claves:
+        cache.set(key, key)
+        for _ in range(3):
+            cache.get(key)
+    # Una clave vista una sola vez no desplaza a las frecuentes
+    assert cache.get("rara") is None
+    assert cache.set("rara", "rara") is False
+    assert all(cache.get(key) == key for key in claves)
+    # Cuando se vuelve más frecuente que la víctima, entra
+    for _ in range(10):
+        cache.get("nueva")
+    assert cache.set("nueva", "nueva") is True
+    assert cache.get("nueva") == "nueva"
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "resultado"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    wait_until(lambda: flight.stats["coalesced"] == 3)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ["resultado"] * 4
+    assert not flight.in_flight("k")
+
+
+def test_single_flight_propagates_exceptions_to_waiters():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream caído")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    wait_until(lambda: flight.stats["coalesced"] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ["upstream caído", "upstream caído"]
+    # La clave se libera: la siguiente llamada vuelve a ejecutar la función
+    with pytest.raises(ValueError):
+        flight.do("k", failing)
+
+
+def test_single_flight_keeps_keys_independent():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats == {"leaders": 2, "coalesced": 0}
+
+
+def make_shared(path, **kwargs):
+    """Caché compartida con su propia copia local, como la de un worker."""
+    kwargs.setdefault("default_ttl", 60)
+    return SharedCache("search", SQLiteCacheBackend(str(path)), make_cache(), **kwargs)
+
+
+def test_shared_cache_is_visible_to_other_workers(tmp_path):
+    worker_a = make_shared(tmp_path / "shared.sqlite3")
+    worker_b = make_shared(tmp_path / "shared.sqlite3")
+    worker_a.set("q", {"total": 3})
+    assert worker_b.get("q") == {"total": 3}
+    assert worker_b.stats["shared_hits"] == 1
+    # La segunda lectura sale de la copia local
+    assert worker_b.get("q") == {"total": 3}
+    assert worker_b.stats["shared_hits"] == 1
+
+
+def test_shared_cache_delete_reaches_backend(tmp_path):
+    worker_a = make_shared(tmp_path / "shared.sqlite3")
+    worker_b = make_shared(tmp_path / "shared.sqlite3")
+    worker_a.set("q", 1)
+    worker_a.delete("q")
+    assert worker_b.get("q") is None
+    assert worker_a.snapshot()["shared_entries"] == 0
+
+
+def test_shared_cache_treats_backend_errors_as_misses(tmp_path):
+    class BrokenBackend:
+        def get(self, namespace, key):
+            raise OSError("disco lleno")
+
+        def set(self, namespace, key, blob, expires_at, keep_until):
+            raise OSError("disco lleno")
+
+    cache = SharedCache("search", BrokenBackend(), make_cache(max_entries=0))
+    assert cache.set("q", 1) is False
+    assert cache.get("q", "default") == "default"
+    assert cache.stats["errors"] == 2
+
+
+def test_private_db_is_owner_only(tmp_path):
+    path = tmp_path / "datos" / "shared.sqlite3"
+    connect_private_db(str(path)).close()
+    assert os.stat(path.parent).st_mode & 0o777 == 0o700
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_private_db_rejects_world_writable_directory(tmp_path):
+    directorio = tmp_path / "publico"
+    directorio.mkdir()
+    directorio.chmod(0o777)
+    with pytest.raises(PermissionError):
+        connect_private_db(str(directorio / "shared.sqlite3"))
+
+
+def _take_tokens(path, attempts, queue):
+    bucket = SQLiteTokenBucket("pna:123", 1, burst=5, path=path)
+    queue.put(sum(bucket.try_acquire(0) is not None for _ in range(attempts)))
+
+
+def test_sqlite_token_bucket_is_shared_across_processes(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    workers = [ctx.Process(target=_take_tokens, args=(path, 10, queue)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    concedidos = sum(queue.get(timeout=30) for _ in workers)
+    for worker in workers:
+        worker.join(30)
+    # Cuatro workers con 10 intentos cada uno no pasan del burst del host
+    assert concedidos == 5
+
+
+def test_sqlite_token_bucket_falls_back_to_local_quota(tmp_path):
+    bloqueado = tmp_path / "ajeno"
+    bloqueado.mkdir()
+    bloqueado.chmod(0o777)
+    bucket = SQLiteTokenBucket("pna:123", 120, path=str(bloqueado / "shared.sqlite3"), workers=4)
+    assert bucket.try_acquire(0) == 0.0
+    assert bucket.stats["errors"] == 1
+    assert bucket._fallback.rate == pytest.approx(30 / 60)
+
+
+def test_image_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "images.sqlite3")
+    PersistentImageCache("images", path=path).set("VP-ABC", "https://img.example/abc.jpg")
+    reiniciada = PersistentImageCache("images", path=path)
+    assert reiniciada.get("VP-ABC") == "https://img.example/abc.jpg"
+    assert reiniciada.stats["loaded"] == 1
+    assert reiniciada.stats["disk_hits"] == 0
+
+
+def test_image_cache_reads_entries_written_by_other_workers(tmp_path):
+    path = str(tmp_path / "images.sqlite3")
+    worker_a = PersistentImageCache("images", path=path)
+    worker_b = PersistentImageCache("images", path=path)
+    assert worker_b.get("VP-ABC") is None
+    worker_a.set("VP-ABC", "https://img.example/abc.jpg")
+    assert worker_b.get(" vp-abc ") == "https://img.example/abc.jpg"
+    assert worker_b.stats["disk_hits"] == 1
+
+
+def test_image_cache_placeholders_expire_sooner(tmp_path):
+    cache = PersistentImageCache("images", path=str(tmp_path / "images.sqlite3"), hit_ttl=3600, placeholder_ttl=60)
+    cache.set("real", "https://img.example/real.jpg")
+    cache.set("falta", "https://via.placeholder.com/300", placeholder=True)
+    ahora = time.time()
+    assert cache.backend.get("images", stable_key("real"))[1] - ahora == pytest.approx(3600, abs=5)
+    assert cache.backend.get("images", stable_key("falta"))[1] - ahora == pytest.approx(60, abs=5)
+    assert cache.stats["placeholders"] == 1
+
+
+def test_delete_where_removes_matching_entries(clock):
+    cache = make_cache(compress=True)
+    cache.set("hp laptop__1_25", {"skus": ["A1"]})
+    cache.set("hp monitor__1_25", {"skus": ["B2"]})
+    cache.set("dell__1_25", {"skus": ["A1"]})
+    assert cache.delete_where(lambda key, value: "A1" in value["skus"]) == 2
+    assert cache.get("hp monitor__1_25") == {"skus": ["B2"]}
+    assert len(cache) == 1
+
+
+def test_shared_delete_where_counts_each_store(tmp_path):
+    worker_a = make_shared(tmp_path / "shared.sqlite3")
+    worker_b = make_shared(tmp_path / "shared.sqlite3")
+    worker_a.set("hp laptop__1_25", 1)
+    worker_a.set("dell__1_25", 2)
+    worker_b.get("dell__1_25")
+    # Los demás workers solo sueltan su copia local; el almacén compartido ya se purgó
+    assert worker_b.delete_where(lambda key, _: True, local_only=True) == {"local": 1}
+    assert worker_a.delete_where(lambda key, _: True) == {"local": 2, "shared": 2}
+    assert worker_b.get("dell__1_25") is None
+
+
+def test_shared_clear_counts_each_store(tmp_path):
+    worker_a = make_shared(tmp_path / "shared.sqlite3")
+    worker_b = make_shared(tmp_path / "shared.sqlite3")
+    worker_a.set("q1", 1)
+    worker_a.set("q2", 2)
+    worker_b.get("q1")
+    assert worker_b.clear(local_only=True) == {"local": 1}
+    assert worker_b.get("q1") == 1
+    assert worker_a.clear() == {"local": 2, "shared": 2}
+    assert worker_a.snapshot()["shared_entries"] == 0
+
+
+def test_invalidation_bus_reaches_other_workers(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    recibidas = []
+    worker_a = InvalidationBus(path=path)
+    worker_b = InvalidationBus(path=path)
+    worker_b._handler = lambda kind, value: recibidas.append((kind, value))
+    assert worker_b.poll() == 0  # un worker nuevo empieza desde la generación actual
+    worker_a.publish("sku", "ABC123")
+    worker_a.publish("all")
+    assert worker_b.poll() == 2
+    assert recibidas == [("sku", "ABC123"), ("all", "")]
+    assert worker_b.poll() == 0
@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import ingram_client
+from cache_store import SQLiteTokenBucket
+from ingram_client import IngramClient, TokenManager
+from resilience import RateLimiter
+
+
+class FakeTokenEndpoint:
+    """Endpoint OAuth simulado: cuenta las llamadas y puede retenerlas hasta `release`."""
+
+    def __init__(self, expires_in=3600, block=False):
+        self.expires_in = expires_in
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("oauth caído")
+        return f"token-{self.calls}", self.expires_in
+
+
+@pytest.fixture
+def make_manager():
+    managers = []
+
+    def factory(fetch, **kwargs):
+        kwargs.setdefault("refresh_margin", 300)
+        kwargs.setdefault("safety_margin", 60)
+        manager = TokenManager(fetch, **kwargs)
+        managers.append(manager)
+        return manager
+
+    yield factory
+    for manager in managers:
+        if manager._timer is not None:
+            manager._timer.cancel()
+
+
+def test_token_refresh_is_single_flight(make_manager):
+    endpoint = FakeTokenEndpoint(block=True)
+    manager = make_manager(endpoint)
+    tokens = []
+
+    def call():
+        tokens.append(manager.get_token())
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert endpoint.started.wait(5)
+    followers = [threading.Thread(target=call) for _ in range(7)]
+    for follower in followers:
+        follower.start()
+    endpoint.release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert endpoint.calls == 1
+    assert tokens == ["token-1"] * 8
+    assert manager.stats["refreshes"] == 1
+
+
+def test_cached_token_is_reused_until_safety_margin(make_manager):
+    endpoint = FakeTokenEndpoint()
+    manager = make_manager(endpoint)
+    assert manager.get_token() == "token-1"
+    assert manager.get_token() == "token-1"
+    # Con menos de `safety_margin` segundos de vida el token ya no se entrega
+    manager._expiry -= 3600 - 59
+    assert manager.get_token() == "token-2"
+    assert endpoint.calls == 2
+
+
+def test_refresh_is_scheduled_before_expiry(make_manager):
+    manager = make_manager(FakeTokenEndpoint(expires_in=3600))
+    manager.get_token()
+    assert manager._timer.daemon
+    assert manager._timer.interval == pytest.approx(3300, abs=1)
+
+
+@pytest.mark.parametrize("expires_in, interval", [(200, 100), (1, 1), (0, 1)])
+def test_short_lived_token_refresh_has_minimum_delay(make_manager, expires_in, interval):
+    manager = make_manager(FakeTokenEndpoint(expires_in=expires_in))
+    manager._refresh_locked()
+    assert manager._timer.interval == pytest.approx(interval, abs=0.1)
+
+
+def test_background_refresh_replaces_token(make_manager):
+    endpoint = FakeTokenEndpoint()
+    manager = make_manager(endpoint)
+    manager.get_token()
+    manager._background_refresh()
+    assert manager.get_token() == "token-2"
+    assert manager.stats["background_refreshes"] == 1
+
+
+def test_failed_background_refresh_retries_while_token_usable(make_manager):
+    endpoint = FakeTokenEndpoint()
+    manager = make_manager(endpoint, retry_delay=30)
+    manager.get_token()
+    endpoint.fail = True
+    manager._background_refresh()
+    assert manager.get_token() == "token-1"
+    assert manager.stats["failures"] == 1
+    assert manager._timer.interval == 30
+
+
+def test_rate_bucket_shares_quota_across_workers(monkeypatch):
+    monkeypatch.setattr(ingram_client, "INGRAM_RATE_LIMIT_SHARED", True)
+    monkeypatch.setattr(ingram_client, "WEB_CONCURRENCY", 4)
+    bucket = ingram_client.rate_bucket("pna:123", 120)
+    assert isinstance(bucket, SQLiteTokenBucket)
+    assert bucket.key == "pna:123"
+    assert bucket.rate == pytest.approx(120 / 60)
+    # Si SQLite falla, cada worker se queda con su parte de la cuota
+    assert bucket._fallback.rate == pytest.approx(30 / 60)
+
+
+def test_rate_bucket_splits_quota_between_workers(monkeypatch):
+    monkeypatch.setattr(ingram_client, "INGRAM_RATE_LIMIT_SHARED", False)
+    monkeypatch.setattr(ingram_client, "WEB_CONCURRENCY", 4)
+    assert ingram_client.rate_bucket("pna:123", 120).rate == pytest.approx(30 / 60)
+    # Nunca menos de una llamada por minuto por worker
+    assert ingram_client.rate_bucket("oauth:123", 2).rate == pytest.approx(1 / 60)
+
+
+class FakeSession:
+    """Sesión HTTP simulada: devuelve los códigos (o lanza las excepciones) de `responses` en orden."""
+
+    def __init__(self, clock, responses, elapsed=0.0):
+        self.clock = clock
+        self.responses = list(responses)
+        self.elapsed = elapsed
+        self.timeouts = []
+        self.headers = []
+
+    def request(self, method, url, **kwargs):
+        self.timeouts.append(kwargs["timeout"])
+        self.headers.append(kwargs.get("headers"))
+        self.clock.advance(self.elapsed)
+        respuesta = self.responses.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        res = requests.Response()
+        res.status_code = respuesta
+        return res
+
+
+@pytest.fixture
+def make_client(clock, monkeypatch):
+    monkeypatch.setattr(ingram_client, "time", SimpleNamespace(
+        monotonic=clock.monotonic, sleep=clock.sleep, time=time.time, perf_counter=time.perf_counter))
+
+    def factory(responses, elapsed=0.0, **kwargs):
+        kwargs.setdefault("max_retries", 3)
+        kwargs.setdefault("backoff_factor", 0.3)
+        client = IngramClient(client_id="id", client_secret="secret", **kwargs)
+        client.rate_limiter = RateLimiter({}, default_per_minute=6000)
+        client._session = FakeSession(clock, responses, elapsed)
+        client._session_pid = os.getpid()
+        return client
+
+    return factory
+
+
+def test_idempotent_call_retries_retryable_status(make_client):
+    client = make_client([503, 429, 200])
+    res = client.get("/resellers/v6/catalog", headers={})
+    assert res.status_code == 200
+    assert len(client.session.timeouts) == 3
+    # Un solo resultado por llamada lógica: el breaker no ve los intentos fallidos
+    assert client.breakers["catalog"].snapshot()["failures"] == 0
+
+
+def test_unauthorized_call_renews_token_once(make_client, make_manager):
+    client = make_client([401, 200])
+    endpoint = FakeTokenEndpoint()
+    client.tokens = make_manager(endpoint)
+    res = client.post("/resellers/v6/orders", headers=client.headers())
+    assert res.status_code == 200
+    assert [h["Authorization"] for h in client.session.headers] == ["Bearer token-1", "Bearer token-2"]
+    assert endpoint.calls == 2
+
+
+def test_unauthorized_call_is_retried_only_once(make_client, make_manager):
+    client = make_client([401, 401, 200])
+    endpoint = FakeTokenEndpoint()
+    client.tokens = make_manager(endpoint)
+    assert client.get("/resellers/v6/catalog").status_code == 401
+    assert len(client.session.timeouts) == 2
+    assert endpoint.calls == 2
+
+
+def test_stale_invalidation_keeps_renewed_token(make_manager):
+    endpoint = FakeTokenEndpoint()
+    manager = make_manager(endpoint)
+    manager.get_token()
+    manager.invalidate("token-1")
+    assert manager.get_token() == "token-2"
+    # Un 401 tardío con el token anterior no descarta el ya renovado
+    manager.invalidate("token-1")
+    assert manager.get_token() == "token-2"
+    assert endpoint.calls == 2
+
+
+def test_non_idempotent_call_is_not_retried_on_status(make_client):
+    client = make_client([503, 200])
+    res = client.post("/resellers/v6/orders", headers={})
+    assert res.status_code == 503
+    assert len(client.session.timeouts) == 1
+    assert client.breakers["catalog"].snapshot()["failures"] == 1
+
+
+def test_connection_errors_are_retried_even_when_not_idempotent(make_client):
+    client = make_client([requests.ConnectTimeout("sin conexión"), 200])
+    res = client.post("/resellers/v6/orders", headers={})
+    assert res.status_code == 200
+    assert len(client.session.timeouts) == 2
+
+
+def test_read_timeouts_are_not_retried_by_default(make_client):
+    client = make_client([requests.ReadTimeout("lento"), 200])
+    with pytest.raises(requests.ReadTimeout):
+        client.get("/resellers/v6/catalog", headers={})
+    assert len(client.session.timeouts) == 1
+    assert client.breakers["catalog"].snapshot()["failures"] == 1
+
+
+def test_failed_retries_count_as_one_breaker_failure(make_client):
+    client = make_client([503] * 4)
+    assert client.get("/resellers/v6/catalog", headers={}).status_code == 503
+    assert len(client.session.timeouts) == 4
+    assert client.breakers["catalog"].snapshot()["failures"] == 1
+
+
+def test_attempts_stay_within_call_deadline(make_client):
+    client = make_client([503] * 4, elapsed=3.0)
+    assert client.get("/resellers/v6/catalog", headers={}, deadline=5).status_code == 503
+    # El segundo intento recibe solo lo que queda del plazo y no hay un tercero
+    assert len(client.session.timeouts) == 2
+    assert client.session.timeouts[0] == (3.05, 5)
+    assert max(client.session.timeouts[1]) < 2
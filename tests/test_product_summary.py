@@ -0,0 +1,78 @@
+import pickle
+
+from jinja2 import Environment
+
+from cache_store import pack_value, unpack_value
+from product_summary import ProductSummary, card_price_fields, truncate_label
+
+ITEM = {
+    "ingramPartNumber": "ABC123",
+    "vendorPartNumber": "VP-ABC",
+    "description": "Laptop HP 14",
+    "vendorName": "HP",
+    "category": None,
+    "subCategory": "Notebooks",
+    "productImages": [{"url": "https://img.example/abc.jpg"}],
+}
+
+PRICE = {
+    "ingramPartNumber": "ABC123",
+    "productStatusCode": "S",
+    "pricing": {"customerPrice": 100.0, "currencyCode": "MXN"},
+    "availability": {"available": True, "totalAvailability": 5, "availabilityByWarehouse": [
+        {"location": "MX", "warehouseName": "CDMX", "warehouseId": 1, "quantityAvailable": 5, "extra": "x"},
+        {"location": "MX", "warehouseName": "GDL", "warehouseId": 2, "quantityAvailable": 0},
+    ]},
+}
+
+
+def test_from_ingram_normalizes_missing_fields():
+    resumen = ProductSummary.from_ingram(ITEM)
+    assert resumen.category == ""
+    assert resumen.image_url == "https://img.example/abc.jpg"
+    assert resumen.card_title == "Laptop HP 14"
+    assert resumen.get("category", "") == ""
+    assert resumen.get("productImages") == [{"url": "https://img.example/abc.jpg"}]
+    assert resumen.get("pricing") is None
+
+
+def test_pickle_round_trip():
+    resumen = ProductSummary.from_ingram(ITEM).with_price(PRICE, card_price_fields(PRICE, "Disponible"))
+    copia = pickle.loads(pickle.dumps(resumen))
+    assert copia == resumen
+    assert copia is not resumen
+    assert unpack_value(pack_value([resumen] * 50)) == [resumen] * 50
+
+
+def test_with_price_returns_projected_copy():
+    resumen = ProductSummary.from_ingram(ITEM)
+    con_precio = resumen.with_price(PRICE, card_price_fields(PRICE, "Disponible"))
+    assert resumen.customer_price is None
+    assert con_precio.customer_price == 100.0
+    assert con_precio.price_label == "MXN $110.0"
+    assert con_precio.show_badge is True
+    assert con_precio.get("pricing") == {"customerPrice": 100.0, "currencyCode": "MXN"}
+    almacenes = con_precio.availability["availabilityByWarehouse"]
+    assert [w["warehouseName"] for w in almacenes] == ["CDMX"]
+    assert "extra" not in almacenes[0]
+
+
+def test_card_title_defaults_and_truncation():
+    assert ProductSummary.from_ingram(dict(ITEM, description=None)).card_title == "Sin descripción"
+    largo = "Laptop " * 30
+    titulo = ProductSummary.from_ingram(dict(ITEM, description=largo)).card_title
+    assert titulo.endswith("...")
+    assert len(titulo) <= 120
+
+
+def test_truncate_label_matches_jinja_truncate():
+    plantilla = Environment().from_string("{{ texto | truncate(20) }}")
+    for texto in ["Disponible", "Disponible en 3 almacenes de CDMX", "x" * 24, "x" * 26]:
+        assert truncate_label(texto, 20) == plantilla.render(texto=texto)
+
+
+def test_with_image_does_not_touch_original():
+    resumen = ProductSummary.from_ingram(dict(ITEM, productImages=[]))
+    assert resumen.image_url is None
+    assert resumen.with_image("https://img.example/x.jpg").image_url == "https://img.example/x.jpg"
+    assert resumen.image_url is None
@@ -0,0 +1,32 @@
+from query_normalizer import CanonicalKeyStats, canonicalize_query, canonicalize_vendor, fold_text
+
+
+def test_fold_text_ignores_case_accents_and_spacing():
+    assert fold_text("  Cámara   WEB\tHD ") == "camara web hd"
+    assert fold_text(None) == ""
+
+
+def test_equivalent_queries_share_canonical_form():
+    variantes = ["HP  Laptop", "hp laptop", "Hp Laptop ", "HP LAPTOP"]
+    assert {canonicalize_query(q) for q in variantes} == {"hp laptop"}
+
+
+def test_vendor_resolves_aliases_and_known_vendors():
+    assert canonicalize_vendor("tp link") == "TP-Link"
+    assert canonicalize_vendor("Todas las marcas") == ""
+    assert canonicalize_vendor("lenovo", ["Dell", "Lenovo"]) == "Lenovo"
+    # Una marca desconocida se conserva tal cual, solo con espacios colapsados
+    assert canonicalize_vendor("  Marca   Nueva ") == "Marca Nueva"
+
+
+def test_canonical_key_stats_counts_hits_gained():
+    stats = CanonicalKeyStats()
+    stats.record("HP Laptop_", "hp laptop_", hit=False)
+    stats.record("hp laptop_", "hp laptop_", hit=True)
+    stats.record("HP  LAPTOP_", "hp laptop_", hit=True)
+    stats.record("HP  LAPTOP_", "hp laptop_", hit=True)
+    snapshot = stats.snapshot()
+    assert snapshot["lookups"] == 4
+    assert snapshot["hits"] == 3
+    # Solo la primera vez que aparece una clave cruda distinta cuenta como ganada
+    assert snapshot["hits_gained_by_canonicalization"] == 1
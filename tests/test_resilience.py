@@ -0,0 +1,97 @@
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, RateLimiter, RateLimitExceeded, TokenBucket, backoff_delay
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("catalog", failure_threshold=3, recovery_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats["rejected"] == 1
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("catalog", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_success_closes(clock):
+    breaker = CircuitBreaker("catalog", failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock.advance(30)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+    # Solo una llamada de prueba a la vez
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_breaker_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker("catalog", failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock.advance(30)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.advance(29)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_backoff_delay_stays_within_capped_window():
+    for attempt in range(8):
+        for _ in range(20):
+            assert 0 <= backoff_delay(attempt, base=0.25, cap=4.0) <= min(4.0, 0.25 * 2 ** attempt)
+
+
+def test_bucket_waits_for_next_token_within_max_wait(clock):
+    bucket = TokenBucket(60, burst=1)  # un token por segundo
+    assert bucket.try_acquire() == 0.0
+    inicio = clock.now
+    assert bucket.try_acquire(max_wait=2) == pytest.approx(1.0)
+    assert clock.now - inicio == pytest.approx(1.0)
+
+
+def test_bucket_rejects_without_consuming_when_wait_too_long(clock):
+    bucket = TokenBucket(60, burst=1)
+    bucket.try_acquire()
+    assert bucket.try_acquire(max_wait=0.5) is None
+    assert bucket.next_available_in() == pytest.approx(1.0)
+    clock.advance(1)
+    assert bucket.try_acquire() == 0.0
+
+
+def test_rate_limiter_raises_when_no_turn(clock):
+    limiter = RateLimiter({"catalog": 6}, max_wait=0)
+    limiter.acquire("catalog", "123")  # burst = 6 // 6 = 1
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("catalog", "123")
+    # Otro número de cliente tiene su propio bucket
+    limiter.acquire("catalog", "456")
+    assert limiter.stats["rejected"] == 1
+
+
+def test_rate_limiter_uses_bucket_factory():
+    creados = []
+
+    def factory(key, rate):
+        creados.append((key, rate))
+        return TokenBucket(rate)
+
+    limiter = RateLimiter({"pna": 120}, bucket_factory=factory)
+    limiter.acquire("pna", "123")
+    limiter.acquire("pna", "123")
+    assert creados == [("pna:123", 120)]